@@ -0,0 +1,166 @@
+import argparse
+import random
+import time
+import numpy as np
+from engine import get_backend
+from engine import Move
+from evaluation import evaluate
+from evaluation import encode_positions
+from evaluation import evaluate_encoded
+
+#Benchmarks for the engine. Run headless, e.g.: python benchmark.py move-cost --backend mailbox
+
+#Both Knights jump out and back again, so the game can go on for as long as needed
+KNIGHT_SHUFFLE = (((7,6), (5,5)), ((0,6), (2,5)), ((5,5), (7,6)), ((2,5), (0,6)))
+
+def move_cost(backend, plies, step, repeat):
+
+    #Play a long game and measure how long make_move + undo_move take at different points of it
+    #The cost should stay the same, no matter how many moves were already made
+
+    state = get_backend(backend)()
+    print("Ply    make_move + undo_move")
+    for ply in range(plies + 1):
+        start, end = KNIGHT_SHUFFLE[ply % len(KNIGHT_SHUFFLE)]
+        move = Move(start, end, state.board)
+        if ply % step == 0 or ply == 1:
+            t = time.perf_counter()
+            for i in range(repeat):
+                state.make_move(move)
+                state.undo_move()
+            elapsed = time.perf_counter() - t
+            print("{:<6} {:8.2f} us".format(ply, elapsed / repeat * 1e6))
+        state.make_move(move)
+
+def random_positions(backend, count, seed):
+
+    #Positions from random games, a new game is started after every 20 to 80 moves or when it ends
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = get_backend(backend)()
+        for ply in range(rng.randint(20, 80)):
+            moves = state.valid_moves()
+            if not moves:
+                break
+            state.make_move(rng.choice(moves))
+        positions.append(get_backend(backend).from_fen(state.to_fen()))
+    return positions
+
+def eval_batch(backend, count, seed, repeat):
+
+    #Compare evaluate called once per position with encode_positions + evaluate_encoded on all of them
+
+    positions = random_positions(backend, count, seed)
+    white_to_move = np.array([state.whiteToMove for state in positions], dtype=bool)
+
+    t = time.perf_counter()
+    for i in range(repeat):
+        single = [evaluate(state) for state in positions]
+    single_time = (time.perf_counter() - t) / repeat
+
+    t = time.perf_counter()
+    for i in range(repeat):
+        planes = encode_positions(positions)
+    encode_time = (time.perf_counter() - t) / repeat
+
+    t = time.perf_counter()
+    for i in range(repeat):
+        batch = evaluate_encoded(planes, white_to_move)
+    batch_time = (time.perf_counter() - t) / repeat
+
+    if list(batch) != single:
+        raise AssertionError("Batch evaluation differs from evaluate")
+
+    print("{} positions".format(count))
+    print("evaluate per position     {:9.2f} ms  {:8.2f} us/position".format(single_time * 1e3, single_time / count * 1e6))
+    print("encode_positions          {:9.2f} ms  {:8.2f} us/position".format(encode_time * 1e3, encode_time / count * 1e6))
+    print("evaluate_encoded          {:9.2f} ms  {:8.2f} us/position".format(batch_time * 1e3, batch_time / count * 1e6))
+    print("encode + evaluate_encoded {:9.2f} ms  ({:.1f}x)".format((encode_time + batch_time) * 1e3,
+        single_time / (encode_time + batch_time)))
+
+def legacy_in_check(state):
+
+    #kingInCheck as it was before the attack tables: Let the King move like every piece and look for that piece
+    #(Pawn moves from the last row are skipped, that check used to be in getPawnMoves)
+
+    row, col = state.whiteKingLocation if state.whiteToMove else state.blackKingLocation
+    enemyColor = 'b' if state.whiteToMove else 'w'
+    for piece in ('p', 'R', 'N', 'B', 'Q'):
+        if piece == 'p' and not 0 <= row + (-1 if state.whiteToMove else 1) < 8:
+            continue
+        moves = []
+        state.getPieceMoves(piece, row, col, moves)
+        for move in moves:
+            if state.board[move.end[0]][move.end[1]] == enemyColor + piece:
+                return True
+    return False
+
+def attacks(count, seed, repeat):
+
+    #Compare the check test by pseudo-moves from the King with the attack tables, and time the attack maps
+
+    #The same positions for both backends (Their move order differs, so random games would too)
+    mailbox = random_positions("mailbox", count, seed)
+    positions = {"mailbox": mailbox, "bitboard": [get_backend("bitboard").from_fen(state.to_fen()) for state in mailbox]}
+
+    t = time.perf_counter()
+    for i in range(repeat):
+        legacy = [legacy_in_check(state) for state in mailbox]
+    legacy_time = (time.perf_counter() - t) / repeat
+    print("{} positions, {} in check".format(count, sum(legacy)))
+    print("pseudo-moves from the King {:9.2f} us/position".format(legacy_time / count * 1e6))
+
+    for backend, states in positions.items():
+        t = time.perf_counter()
+        for i in range(repeat):
+            checks = [state.kingInCheck() for state in states]
+        check_time = (time.perf_counter() - t) / repeat
+        if checks != legacy:
+            raise AssertionError("kingInCheck of {} differs from the pseudo-move check".format(backend))
+
+        t = time.perf_counter()
+        for i in range(repeat):
+            maps = [(state.attackMap('w'), state.attackMap('b')) for state in states]
+        map_time = (time.perf_counter() - t) / repeat
+        if backend == "mailbox":
+            mailbox_maps = maps
+        elif maps != mailbox_maps:
+            raise AssertionError("Attack maps of bitboard differ from mailbox")
+
+        print("{:<8} kingInCheck     {:9.2f} us/position  ({:.1f}x)".format(backend, check_time / count * 1e6,
+            legacy_time / check_time))
+        print("{:<8} attackMap x2    {:9.2f} us/position".format(backend, map_time / count * 1e6))
+
+def main():
+    parser = argparse.ArgumentParser(description="Engine benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parser_move_cost = subparsers.add_parser("move-cost", help="cost of make_move/undo_move over a long game")
+    parser_move_cost.add_argument("--backend", default="mailbox", choices=("mailbox", "bitboard"))
+    parser_move_cost.add_argument("--plies", type=int, default=300)
+    parser_move_cost.add_argument("--step", type=int, default=50)
+    parser_move_cost.add_argument("--repeat", type=int, default=2000)
+
+    parser_eval_batch = subparsers.add_parser("eval-batch", help="evaluate vs. vectorized batch evaluation")
+    parser_eval_batch.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    parser_eval_batch.add_argument("--positions", type=int, default=2000)
+    parser_eval_batch.add_argument("--seed", type=int, default=0)
+    parser_eval_batch.add_argument("--repeat", type=int, default=5)
+
+    parser_attacks = subparsers.add_parser("attacks", help="check test by pseudo-moves vs. attack tables")
+    parser_attacks.add_argument("--positions", type=int, default=2000)
+    parser_attacks.add_argument("--seed", type=int, default=0)
+    parser_attacks.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.benchmark == "move-cost":
+        move_cost(args.backend, args.plies, args.step, args.repeat)
+    elif args.benchmark == "eval-batch":
+        eval_batch(args.backend, args.positions, args.seed, args.repeat)
+    elif args.benchmark == "attacks":
+        attacks(args.positions, args.seed, args.repeat)
+
+if __name__ == "__main__":
+    main()
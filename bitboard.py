@@ -0,0 +1,377 @@
+from engine import GameState
+from engine import Move
+from engine import PROMOTION_PIECES
+from engine import CASTLE_WHITE_SHORT, CASTLE_WHITE_LONG, CASTLE_BLACK_SHORT, CASTLE_BLACK_LONG
+
+#Bitboard backend: The position is stored as one 64-bit integer per piece type and color
+#Bit n of a bitboard is set if the piece stands on square n. Squares are numbered row by row: square = row * 8 + col
+#(So a8 is square 0 and h1 is square 63, just like the rows and cols of GameState.board)
+
+PIECES = ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+BITS = [1 << sq for sq in range(64)]
+FULL = (1 << 64) - 1
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2))
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+def offset_table(offsets):
+
+    #For every square: Bitboard of all squares that can be reached with one of the offsets
+
+    table = []
+    for sq in range(64):
+        row, col = SQUARES[sq]
+        mask = 0
+        for d in offsets:
+            if 0 <= row + d[0] < 8 and 0 <= col + d[1] < 8:
+                mask |= BITS[(row + d[0]) * 8 + col + d[1]]
+        table.append(mask)
+    return table
+
+def ray_table(direction):
+
+    #For every square: Bitboard of all squares in one direction until the edge of the board
+
+    table = []
+    for sq in range(64):
+        row, col = SQUARES[sq]
+        mask = 0
+        for i in range(1, 8):
+            if not (0 <= row + direction[0] * i < 8 and 0 <= col + direction[1] * i < 8):
+                break
+            mask |= BITS[(row + direction[0] * i) * 8 + col + direction[1] * i]
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = offset_table(KING_OFFSETS)
+
+#Squares attacked by a Pawn of the given color standing on a square
+PAWN_ATTACKS = {'w': offset_table(((-1, -1), (-1, 1))), 'b': offset_table(((1, -1), (1, 1)))}
+
+RAYS = {d: ray_table(d) for d in KING_OFFSETS}
+
+#Sliding pieces: For every square a tuple of (ray, ray points to higher squares, rays of that direction)
+#The first blocker on a ray towards higher squares is its lowest set bit, otherwise its highest set bit
+ROOK_RAYS = [tuple((RAYS[d][sq], d[0] * 8 + d[1] > 0, RAYS[d]) for d in ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_RAYS = [tuple((RAYS[d][sq], d[0] * 8 + d[1] > 0, RAYS[d]) for d in BISHOP_DIRECTIONS) for sq in range(64)]
+
+def between_table():
+
+    #BETWEEN[a][b]: Bitboard of the squares strictly between a and b if they share a line, otherwise 0
+
+    table = [[0] * 64 for sq in range(64)]
+    for sq in range(64):
+        row, col = SQUARES[sq]
+        for d in KING_OFFSETS:
+            mask = 0
+            for i in range(1, 8):
+                if not (0 <= row + d[0] * i < 8 and 0 <= col + d[1] * i < 8):
+                    break
+                target = (row + d[0] * i) * 8 + col + d[1] * i
+                table[sq][target] = mask
+                mask |= BITS[target]
+    return table
+
+BETWEEN = between_table()
+
+def lsb(mask):
+    return (mask & -mask).bit_length() - 1
+
+def sliding_attacks(sq, occupied, rays):
+
+    #Follow every ray until the first blocker. The blocker itself is attacked, everything behind it is not
+
+    attacks = 0
+    for ray, positive, table in rays[sq]:
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+class BitboardGameState(GameState):
+
+    #Same API as GameState, but moves are generated from bitboards
+    #GameState still does the bookkeeping in make_move/undo_move, the bitboards are updated on top of it
+    #The board is kept as a list of lists instead of a NumPy array, because indexing it is much faster
+
+    def __init__(self):
+
+        super().__init__()
+        self.board = self.board.tolist()
+        self.setBitboards()
+
+    def set_fen(self, fen):
+        super().set_fen(fen)
+        self.setBitboards()
+
+    def loadSnapshot(self, snapshot):
+        super().loadSnapshot(snapshot)
+        self.setBitboards()
+
+    def setBitboards(self):
+        self.pieces = dict.fromkeys(PIECES, 0)
+        for sq in range(64):
+            piece = self.board[sq // 8][sq % 8]
+            if piece != "--":
+                self.pieces[piece] |= BITS[sq]
+
+    def make_move(self, move):
+        super().make_move(move)
+        self.updateBitboards(move)
+
+    def undo_move(self):
+        if len(self.moveLog) > 0:
+            move = self.moveLog[-1]
+            super().undo_move()
+            self.updateBitboards(move)
+
+    def updateBitboards(self, move):
+
+        #Every change is a XOR, so calling this again with the same move reverts it (Used by undo_move)
+
+        pieces = self.pieces
+        piece = move.pieceMoved
+        start = move.start[0] * 8 + move.start[1]
+        end = move.end[0] * 8 + move.end[1]
+
+        pieces[piece] ^= BITS[start]
+        if move.promotionPiece:
+            pieces[piece[0] + move.promotionPiece] ^= BITS[end]
+        else: pieces[piece] ^= BITS[end]
+
+        if move.pieceCaptured != "--":
+            pieces[move.pieceCaptured] ^= BITS[end]
+        elif piece[1] == 'p' and move.start[1] != move.end[1]:
+            #En passant: The captured Pawn stands behind the end square
+            if piece[0] == 'w':
+                pieces["bp"] ^= BITS[end + 8]
+            else: pieces["wp"] ^= BITS[end - 8]
+        elif piece[1] == 'K' and move.start[1] < move.end[1] - 1:
+            pieces[piece[0] + 'R'] ^= BITS[end + 1] | BITS[end - 1]
+        elif piece[1] == 'K' and move.start[1] > move.end[1] + 1:
+            pieces[piece[0] + 'R'] ^= BITS[end - 2] | BITS[end + 1]
+
+    def occupied(self, color):
+        pieces = self.pieces
+        return (pieces[color + 'p'] | pieces[color + 'R'] | pieces[color + 'N'] | pieces[color + 'B']
+            | pieces[color + 'Q'] | pieces[color + 'K'])
+
+    def attackers(self, sq, color, occupied):
+
+        #Bitboard of all pieces of color that attack square sq
+
+        pieces = self.pieces
+        ownColor = 'b' if color == 'w' else 'w'
+        return ((KNIGHT_ATTACKS[sq] & pieces[color + 'N'])
+            | (PAWN_ATTACKS[ownColor][sq] & pieces[color + 'p'])
+            | (KING_ATTACKS[sq] & pieces[color + 'K'])
+            | (sliding_attacks(sq, occupied, ROOK_RAYS) & (pieces[color + 'R'] | pieces[color + 'Q']))
+            | (sliding_attacks(sq, occupied, BISHOP_RAYS) & (pieces[color + 'B'] | pieces[color + 'Q'])))
+
+    def squareAttacked(self, row, col, color, ignore=None):
+        occupied = self.occupied('w') | self.occupied('b')
+        if ignore is not None:
+            occupied &= ~BITS[ignore[0] * 8 + ignore[1]]
+        return self.attackers(row * 8 + col, color, occupied) != 0
+
+    def attackMap(self, color):
+
+        #All squares attacked by the pieces of color (Same as GameState.attackMap)
+
+        pieces = self.pieces
+        occupied = self.occupied('w') | self.occupied('b')
+        attacks = 0
+        for piece, table in (('N', KNIGHT_ATTACKS), ('K', KING_ATTACKS), ('p', PAWN_ATTACKS[color])):
+            squares = pieces[color + piece]
+            while squares:
+                attacks |= table[lsb(squares)]
+                squares &= squares - 1
+        for piece, rays in (('R', (ROOK_RAYS,)), ('B', (BISHOP_RAYS,)), ('Q', (ROOK_RAYS, BISHOP_RAYS))):
+            squares = pieces[color + piece]
+            while squares:
+                sq = lsb(squares)
+                squares &= squares - 1
+                for r in rays:
+                    attacks |= sliding_attacks(sq, occupied, r)
+        return attacks
+
+    def kingInCheck(self):
+        ownColor, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        occupied = self.occupied('w') | self.occupied('b')
+        return self.attackers(lsb(self.pieces[ownColor + 'K']), enemyColor, occupied) != 0
+
+    def generateValidMoves(self):
+        return self.generateMoves(True)
+
+    def generateValidMovesOfKind(self, captures):
+        return self.generateMoves(True, captures)
+
+    def generateValidMovesFrom(self, square):
+        return self.generateMoves(True, None, BITS[square])
+
+    def possible_moves(self):
+        return self.generateMoves(False)
+
+    def generateMoves(self, legal, captures=None, fromMask=FULL):
+
+        #Legal moves are generated directly: Checks and pins are computed once for the position,
+        #then every piece can only move to squares that resolve a check and keep it on its pin line
+        #Without legal, only the moves of GameState.possible_moves are generated
+        #captures: True for only captures, False for only quiet moves, None for both
+        #fromMask: Only moves of the pieces on these squares
+
+        board = self.board
+        pieces = self.pieces
+        ownColor, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        own = self.occupied(ownColor)
+        enemy = self.occupied(enemyColor)
+        occupied = own | enemy
+        if captures is None:
+            notOwn = ~own & FULL
+        elif captures:
+            notOwn = enemy
+        else: notOwn = ~occupied & FULL
+        moves = []
+
+        king = lsb(pieces[ownColor + 'K'])
+        checkers = self.attackers(king, enemyColor, occupied)
+        checkMask = FULL
+        pins = {}
+        if legal:
+            if checkers:
+                checker = lsb(checkers)
+                checkMask = BETWEEN[king][checker] | BITS[checker] if checkers == BITS[checker] else 0
+
+            #Enemy sliders that would attack the King if there were no own pieces in between
+            #If exactly one own piece is in between, it is pinned and may only move between King and slider
+            snipers = ((sliding_attacks(king, enemy, ROOK_RAYS) & (pieces[enemyColor + 'R'] | pieces[enemyColor + 'Q']))
+                | (sliding_attacks(king, enemy, BISHOP_RAYS) & (pieces[enemyColor + 'B'] | pieces[enemyColor + 'Q'])))
+            while snipers:
+                sniper = lsb(snipers)
+                snipers &= snipers - 1
+                blockers = BETWEEN[king][sniper] & occupied
+                if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                    pins[lsb(blockers)] = BETWEEN[king][sniper] | BITS[sniper]
+
+        #King moves: Not next to the enemy King, and if legal only to squares that are not attacked
+        #The King itself is removed from the board, so it can't hide behind itself from a slider
+        targets = KING_ATTACKS[king] & notOwn if fromMask & BITS[king] else 0
+        start = SQUARES[king]
+        while targets:
+            target = lsb(targets)
+            targets &= targets - 1
+            if legal:
+                if self.attackers(target, enemyColor, occupied ^ BITS[king]):
+                    continue
+            elif KING_ATTACKS[target] & pieces[enemyColor + 'K']:
+                continue
+            moves.append(Move(start, SQUARES[target], board))
+
+        if not checkers and not captures and fromMask & BITS[king]:
+            self.getCastleMoves(king, ownColor, enemyColor, occupied, legal, moves)
+
+        #Double check: Only the King can move
+        if checkMask == 0:
+            return moves
+
+        targetMask = notOwn & checkMask
+
+        for piece, rays in ((ownColor + 'R', (ROOK_RAYS,)), (ownColor + 'B', (BISHOP_RAYS,)),
+            (ownColor + 'Q', (ROOK_RAYS, BISHOP_RAYS)), (ownColor + 'N', None)):
+            squares = pieces[piece] & fromMask
+            while squares:
+                sq = lsb(squares)
+                squares &= squares - 1
+                if rays is None:
+                    targets = KNIGHT_ATTACKS[sq] & targetMask
+                else:
+                    targets = 0
+                    for r in rays:
+                        targets |= sliding_attacks(sq, occupied, r)
+                    targets &= targetMask
+                if sq in pins:
+                    targets &= pins[sq]
+                start = SQUARES[sq]
+                while targets:
+                    target = lsb(targets)
+                    targets &= targets - 1
+                    moves.append(Move(start, SQUARES[target], board))
+
+        self.getPawnBitboardMoves(ownColor, enemyColor, king, occupied, enemy, checkMask, pins, legal, captures, fromMask, moves)
+        return moves
+
+    def getPawnBitboardMoves(self, ownColor, enemyColor, king, occupied, enemy, checkMask, pins, legal, captures, fromMask, moves):
+
+        board = self.board
+        pieces = self.pieces
+        forward = -8 if ownColor == 'w' else 8
+        startRow = 6 if ownColor == 'w' else 1
+        attacks = PAWN_ATTACKS[ownColor]
+        enPassant = self.enPassantPossible[0] * 8 + self.enPassantPossible[1] if self.enPassantPossible and captures is not False else -1
+        pushes = not captures
+        enemy = enemy if captures is not False else 0
+
+        squares = pieces[ownColor + 'p'] & fromMask
+        while squares:
+            sq = lsb(squares)
+            squares &= squares - 1
+            targets = 0
+            if pushes and not occupied & BITS[sq + forward]:
+                targets |= BITS[sq + forward]
+                if sq // 8 == startRow and not occupied & BITS[sq + 2 * forward]:
+                    targets |= BITS[sq + 2 * forward]
+            targets |= attacks[sq] & enemy
+            targets &= checkMask
+            if sq in pins:
+                targets &= pins[sq]
+            start = SQUARES[sq]
+            while targets:
+                target = lsb(targets)
+                targets &= targets - 1
+                if target < 8 or target >= 56:
+                    for promotionPiece in PROMOTION_PIECES:
+                        moves.append(Move(start, SQUARES[target], board, promotionPiece))
+                else: moves.append(Move(start, SQUARES[target], board))
+
+            if enPassant >= 0 and attacks[sq] & BITS[enPassant]:
+                if legal:
+                    #Removing two Pawns from the same row can expose the King, so the position after the capture
+                    #is checked as a whole instead of using the check mask and pins
+                    captured = enPassant - forward
+                    after = occupied ^ BITS[sq] ^ BITS[captured] | BITS[enPassant]
+                    if ((sliding_attacks(king, after, ROOK_RAYS) & (pieces[enemyColor + 'R'] | pieces[enemyColor + 'Q']))
+                        or (sliding_attacks(king, after, BISHOP_RAYS) & (pieces[enemyColor + 'B'] | pieces[enemyColor + 'Q']))
+                        or KNIGHT_ATTACKS[king] & pieces[enemyColor + 'N']
+                        or attacks[king] & pieces[enemyColor + 'p'] & ~BITS[captured]):
+                        continue
+                moves.append(Move(start, SQUARES[enPassant], board))
+
+    def getCastleMoves(self, king, ownColor, enemyColor, occupied, legal, moves):
+
+        #Same rules as GameState.castle: Castling right not lost, no pieces in the way,
+        #the King is not in Check and doesn't move through Check (and if legal: not into Check)
+
+        if ownColor == 'w':
+            short, long = CASTLE_WHITE_SHORT, CASTLE_WHITE_LONG
+        else: short, long = CASTLE_BLACK_SHORT, CASTLE_BLACK_LONG
+
+        for direction, right in ((-1, long), (1, short)):
+            if not self.castlingRights & right:
+                continue
+            path = BITS[king + direction] | BITS[king + 2 * direction]
+            if direction == -1:
+                path |= BITS[king - 3]
+            if occupied & path:
+                continue
+            if self.attackers(king + direction, enemyColor, occupied):
+                continue
+            if legal and self.attackers(king + 2 * direction, enemyColor, occupied):
+                continue
+            moves.append(Move(SQUARES[king], SQUARES[king + 2 * direction], self.board))
@@ -0,0 +1,150 @@
+import argparse
+import mmap
+import random
+import struct
+import sys
+from pgn import read_games
+from pgn import replay_game
+from engine import get_backend
+from engine import START_FEN
+
+#Opening book: Moves played in a collection of games, looked up by position hash (GameState.zobristKey)
+#The book is compiled from PGN files into one binary file of records sorted by hash. The file is memory-mapped and
+#searched with a binary search, so opening a book costs the same and uses no extra memory no matter how big it is
+#
+#   python book.py build games.pgn --output book.bin --plies 20
+#   python book.py probe book.bin --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+#
+#File format: MAGIC, then one record per (position, move): hash (8 bytes), Move.moveID (4 bytes), weight (4 bytes),
+#little-endian, sorted by hash and then by weight (Highest first)
+#The hashes are this engine's Zobrist keys, so the books are not compatible with other programs
+
+MAGIC = b"CHSBOOK1"
+RECORD = struct.Struct("<QII")
+KEY = struct.Struct("<Q")
+
+#Weight a move gets for every game it was played in, by the result for the player who made it
+WIN_WEIGHT = 2
+DRAW_WEIGHT = 1
+LOSS_WEIGHT = 0
+
+class OpeningBook():
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise ValueError("Not an opening book: " + path)
+        self.count = (len(self.data) - len(MAGIC)) // RECORD.size
+
+    def close(self):
+        self.data.close()
+
+    def entries(self, key):
+
+        #All (moveID, weight) stored for a position hash, highest weight first
+
+        data = self.data
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, len(MAGIC) + middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else: high = middle
+
+        entries = []
+        while low < self.count:
+            record_key, moveID, weight = RECORD.unpack_from(data, len(MAGIC) + low * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((moveID, weight))
+            low += 1
+        return entries
+
+    def moves(self, state):
+
+        #(Move, weight) of all book moves that are valid in the position (A hash collision could give invalid ones)
+
+        moves = []
+        for moveID, weight in self.entries(state.zobristKey):
+            move = state.get_valid_move(moveID)
+            if move is not None:
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, state, rng=random):
+
+        #Pick a book move at random, moves with a higher weight more often. None if the position is not in the book
+
+        moves = [(move, weight) for move, weight in self.moves(state) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+def build_book(paths, output, plies=20, min_weight=1, backend="bitboard"):
+
+    #Count the first plies moves of every game in the PGN files and write the book
+    #Moves with a total weight below min_weight are left out. Returns the number of games and of records
+
+    weights = {}
+    games = 0
+    for path in paths:
+        with open(path) as stream:
+            for game in read_games(stream):
+                games += 1
+                if game.result == "1-0":
+                    white, black = WIN_WEIGHT, LOSS_WEIGHT
+                elif game.result == "0-1":
+                    white, black = LOSS_WEIGHT, WIN_WEIGHT
+                else: white = black = DRAW_WEIGHT
+                try:
+                    for ply, (state, move) in enumerate(replay_game(game, backend)):
+                        if ply >= plies:
+                            break
+                        entry = (state.zobristKey, move.moveID)
+                        weights[entry] = weights.get(entry, 0) + (white if state.whiteToMove else black)
+                except ValueError as error:
+                    sys.stderr.write("Game {} skipped after the illegal move: {}\n".format(games, error))
+
+    records = sorted(((key, moveID, weight) for (key, moveID), weight in weights.items() if weight >= min_weight),
+        key=lambda record: (record[0], -record[2]))
+    with open(output, "wb") as file:
+        file.write(MAGIC)
+        for record in records:
+            file.write(RECORD.pack(*record))
+    return games, len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Opening book tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="compile PGN files into a book")
+    parser_build.add_argument("pgn", nargs="+")
+    parser_build.add_argument("--output", default="book.bin")
+    parser_build.add_argument("--plies", type=int, default=20, help="moves per game that go into the book")
+    parser_build.add_argument("--min-weight", type=int, default=1, help="leave out moves with a lower total weight")
+
+    parser_probe = subparsers.add_parser("probe", help="show the book moves of a position")
+    parser_probe.add_argument("book")
+    parser_probe.add_argument("--fen", default=START_FEN)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        games, records = build_book(args.pgn, args.output, args.plies, args.min_weight)
+        print("{} games, {} book entries written to {}".format(games, records, args.output))
+    else:
+        book = OpeningBook(args.book)
+        state = get_backend("bitboard").from_fen(args.fen)
+        moves = book.moves(state)
+        total = sum(weight for move, weight in moves)
+        for move, weight in moves:
+            print("{:8} {:6} {:6.1%}".format(move.get_uci_notation(), weight, weight / total if total > 0 else 0))
+        if not moves:
+            print("Position not in book")
+        book.close()
+
+if __name__ == "__main__":
+    main()
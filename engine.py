@@ -1,4 +1,101 @@
 import numpy as np
+from collections import namedtuple
+from enum import Enum
+from zobrist import ZOBRIST_PIECES, ZOBRIST_BLACK_TO_MOVE, ZOBRIST_CASTLING
+from zobrist import en_passant_key, hash_position
+
+#Castling rights, stored together as bits in GameState.castlingRights
+CASTLE_WHITE_SHORT = 1
+CASTLE_WHITE_LONG = 2
+CASTLE_BLACK_SHORT = 4
+CASTLE_BLACK_LONG = 8
+CASTLE_ALL = 15
+
+#For every square: The castling rights that are kept when a move starts or ends on that square
+CASTLING_RIGHTS_KEPT = [[CASTLE_ALL] * 8 for row in range(8)]
+CASTLING_RIGHTS_KEPT[0][0] = CASTLE_ALL & ~CASTLE_BLACK_LONG
+CASTLING_RIGHTS_KEPT[0][4] = CASTLE_ALL & ~(CASTLE_BLACK_SHORT | CASTLE_BLACK_LONG)
+CASTLING_RIGHTS_KEPT[0][7] = CASTLE_ALL & ~CASTLE_BLACK_SHORT
+CASTLING_RIGHTS_KEPT[7][0] = CASTLE_ALL & ~CASTLE_WHITE_LONG
+CASTLING_RIGHTS_KEPT[7][4] = CASTLE_ALL & ~(CASTLE_WHITE_SHORT | CASTLE_WHITE_LONG)
+CASTLING_RIGHTS_KEPT[7][7] = CASTLE_ALL & ~CASTLE_WHITE_SHORT
+
+#Position at the start of a game in Forsyth-Edwards Notation
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FEN_PIECES = {"P": 'p', "R": 'R', "N": 'N', "B": 'B', "Q": 'Q', "K": 'K'}
+PIECES_FEN = {piece: char for char, piece in FEN_PIECES.items()}
+FEN_CASTLING = {"K": CASTLE_WHITE_SHORT, "Q": CASTLE_WHITE_LONG, "k": CASTLE_BLACK_SHORT, "q": CASTLE_BLACK_LONG}
+#For every castling right: The pieces that must still stand on their starting squares
+CASTLING_PIECES = {CASTLE_WHITE_SHORT: (((7,4), "wK"), ((7,7), "wR")), CASTLE_WHITE_LONG: (((7,4), "wK"), ((7,0), "wR")),
+    CASTLE_BLACK_SHORT: (((0,4), "bK"), ((0,7), "bR")), CASTLE_BLACK_LONG: (((0,4), "bK"), ((0,0), "bR"))}
+
+#Precomputed squares for attack queries, so they need no bounds checks and allocate nothing
+#ROOK_LINES/BISHOP_LINES[row][col]: For every direction the squares until the edge of the board, nearest first
+#KNIGHT_SQUARES/KING_SQUARES[row][col]: Squares a Knight/King on that square attacks
+#PAWN_ATTACKER_SQUARES[color][row][col]: Squares from which a Pawn of color attacks the square
+def square_lines(directions):
+    return [[tuple(tuple((row + d[0] * i, col + d[1] * i) for i in range(1, 8)
+        if 0 <= row + d[0] * i < 8 and 0 <= col + d[1] * i < 8) for d in directions)
+        for col in range(8)] for row in range(8)]
+
+def offset_squares(offsets):
+    return [[tuple((row + d[0], col + d[1]) for d in offsets if 0 <= row + d[0] < 8 and 0 <= col + d[1] < 8)
+        for col in range(8)] for row in range(8)]
+
+ROOK_LINES = square_lines(((-1,0), (0,-1), (1,0), (0,1)))
+BISHOP_LINES = square_lines(((-1,-1), (-1,1), (1,-1), (1,1)))
+KNIGHT_SQUARES = offset_squares(((-2,-1), (-2,1), (2,-1), (2,1), (-1,-2), (-1,2), (1,-2), (1,2)))
+KING_SQUARES = offset_squares(((-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)))
+PAWN_ATTACKER_SQUARES = {'w': offset_squares(((1,-1), (1,1))), 'b': offset_squares(((-1,-1), (-1,1)))}
+#For every color: The lines to look along with the sliding pieces that attack along them, and the Knight, King and Pawn names
+SLIDING_ATTACKERS = {color: ((ROOK_LINES, (color + 'R', color + 'Q')), (BISHOP_LINES, (color + 'B', color + 'Q')))
+    for color in "wb"}
+STEPPING_ATTACKERS = {color: (color + 'N', color + 'K', color + 'p') for color in "wb"}
+
+#Snapshot: Immutable copy of a position that can be hashed, compared and sent to other processes (See GameState.snapshot)
+#board: 64 bytes, one per square (row * 8 + col), the index of the piece in SNAPSHOT_PIECES
+#state: Side to move (bit 0), castling rights (bits 1-4), En passant square + 1 (bits 5-11, 0 if none),
+#halfmove clock (bits 12-27) and move number (from bit 28)
+#key: The Zobrist key, so it doesn't have to be computed again
+Snapshot = namedtuple("Snapshot", "board state key")
+SNAPSHOT_PIECES = ("--", "wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+SNAPSHOT_CODES = {piece: code for code, piece in enumerate(SNAPSHOT_PIECES)}
+
+def square_attacked(board, row, col, color, ignore=None):
+
+    #Check if a piece of color attacks the square, using the precomputed squares (Nothing is allocated)
+    #Works on any board indexed [row][col], e.g. one that is checked before it becomes a GameState's
+    #ignore: A square that counts as empty
+
+    ignoreRow, ignoreCol = ignore if ignore is not None else (-1, -1)
+    for lines, attackers in SLIDING_ATTACKERS[color]:
+        for line in lines[row][col]:
+            for r, c in line:
+                piece = board[r][c]
+                if piece != "--" and (r != ignoreRow or c != ignoreCol):
+                    if piece in attackers:
+                        return True
+                    break
+
+    knight, king, pawn = STEPPING_ATTACKERS[color]
+    for r, c in KNIGHT_SQUARES[row][col]:
+        if board[r][c] == knight:
+            return True
+    for r, c in KING_SQUARES[row][col]:
+        if board[r][c] == king:
+            return True
+    for r, c in PAWN_ATTACKER_SQUARES[color][row][col]:
+        if board[r][c] == pawn:
+            return True
+    return False
+
+class GameResult(Enum):
+    ONGOING = "Ongoing"
+    CHECKMATE = "Checkmate"
+    STALEMATE = "Stalemate"
+    REPETITION = "Repetition"
+    FIFTY_MOVE_RULE = "Fifty-move rule"
 
 class GameState():
 
@@ -19,13 +116,20 @@ class GameState():
         #Who's turn is it?
         self.whiteToMove = True
         
-        #Remember which Kings and Rooks where previously moved (Important for Castling)
-        self.whiteKingMoved = False
-        self.blackKingMoved = False
-        self.leftWhiteRookMoved = False
-        self.rightWhiteRookMoved = False
-        self.leftBlackRookMoved = False
-        self.rightBlackRookMoved = False
+        #Castling rights as bits (See CASTLE_WHITE_SHORT etc.), all four are possible at the start
+        #Previous rights are kept on a stack, so undo_move can restore them without replaying the move list
+        self.castlingRights = CASTLE_ALL
+        self.castlingRightsLog = []
+        
+        #Square a Pawn skipped with a two square move in the previous turn (Empty if there is none)
+        #An enemy Pawn can capture it there by En passant
+        self.enPassantPossible = ()
+        self.enPassantLog = []
+        
+        #Moves since the last capture or Pawn move (For the fifty-move rule) and number of the current move
+        self.halfmoveClock = 0
+        self.halfmoveClockLog = []
+        self.fullmoveNumber = 1
         
         #Remember current location of both Kings (Important for Checks)
         self.whiteKingLocation = (7,4)
@@ -34,10 +138,242 @@ class GameState():
         #List of all moves that were made
         self.moveLog = []
         
+        #Hash of the position (See zobrist.py), updated with every move
+        self.zobristKey = hash_position(self)
+        self.zobristKeyLog = []
+        
+        #How often every position (by hash) occurred in this game (For draw by repetition)
+        self.positionCounts = {self.zobristKey: 1}
+        
+        #Valid moves and check status of the last position they were computed for
+        self.movesCacheKey = None
+        self.cachedMoves = []
+        self.checkCacheKey = None
+        self.cachedCheck = False
+        
+        #Snapshots saved by push_snapshot, with the length of the move list at that time
+        self.snapshots = []
+        
+    @classmethod
+    def from_fen(cls, fen):
+    
+        #Create a game that starts from the position described by a FEN string
+        
+        state = cls()
+        state.set_fen(fen)
+        return state
+        
+    def set_fen(self, fen):
+    
+        #Set up the position of a FEN string, e.g. START_FEN
+        #Fields: Board (from rank 8 to rank 1), side to move, castling rights, En passant square, halfmove clock, move number
+        
+        fields = fen.split()
+        if len(fields) == 4:
+            fields += ["0", "1"]
+        if len(fields) != 6:
+            raise ValueError("FEN needs 6 fields: " + fen)
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+            
+        #Everything is checked before the position is changed, so an invalid FEN leaves it as it was
+        board = [["--"] * 8 for row in range(8)]
+        kings = {}
+        for row in range(8):
+            col = 0
+            for char in rows[row]:
+                if char.isdigit():
+                    col += int(char)
+                elif char.upper() in FEN_PIECES and col < 8:
+                    piece = ('w' if char.isupper() else 'b') + FEN_PIECES[char.upper()]
+                    if piece[1] == 'p' and row in (0, 7):
+                        raise ValueError("FEN has a Pawn on the first or last rank: " + fen)
+                    board[row][col] = piece
+                    if piece[1] == 'K':
+                        kings.setdefault(piece, []).append((row, col))
+                    col += 1
+                else: raise ValueError("Invalid FEN board: " + fen)
+            if col != 8:
+                raise ValueError("FEN rank needs 8 squares: " + fen)
+        if len(kings.get("wK", ())) != 1 or len(kings.get("bK", ())) != 1:
+            raise ValueError("FEN needs exactly one King of each color: " + fen)
+                
+        if fields[1] not in ("w", "b"):
+            raise ValueError("Invalid side to move in FEN: " + fen)
+        whiteToMove = fields[1] == "w"
+        #The player who just moved can't have left his King in Check
+        king, enemyColor = (kings["bK"][0], 'w') if whiteToMove else (kings["wK"][0], 'b')
+        if square_attacked(board, king[0], king[1], enemyColor):
+            raise ValueError("FEN has the player who isn't to move in Check: " + fen)
+        
+        castlingRights = 0
+        if fields[2] != "-":
+            for char in fields[2]:
+                if char not in FEN_CASTLING:
+                    raise ValueError("Invalid castling rights in FEN: " + fen)
+                castlingRights |= FEN_CASTLING[char]
+        #Rights of a King or Rook that is not on its starting square can't be used anymore
+        for right, pieces in CASTLING_PIECES.items():
+            if any(board[square[0]][square[1]] != piece for square, piece in pieces):
+                castlingRights &= ~right
+                
+        #The En passant square was skipped by an enemy Pawn: On rank 6 if White is to move, on rank 3 if Black is,
+        #it and the Pawn's starting square are empty and the Pawn stands right in front of it
+        if fields[3] == "-":
+            enPassantPossible = ()
+        elif len(fields[3]) == 2 and fields[3][0] in Move.fileToCol and fields[3][1] == ("6" if whiteToMove else "3"):
+            row, col = Move.rankToRow[fields[3][1]], Move.fileToCol[fields[3][0]]
+            direction = 1 if whiteToMove else -1
+            if (board[row][col] != "--" or board[row - direction][col] != "--"
+                or board[row + direction][col] != ('b' if whiteToMove else 'w') + 'p'):
+                raise ValueError("En passant square in FEN without the Pawn that skipped it: " + fen)
+            enPassantPossible = (row, col)
+        else: raise ValueError("Invalid En passant square in FEN: " + fen)
+        
+        if not (fields[4].isdigit() and fields[5].isdigit()):
+            raise ValueError("Invalid move counters in FEN: " + fen)
+        for row in range(8):
+            for col in range(8):
+                self.board[row][col] = board[row][col]
+        self.whiteKingLocation = kings["wK"][0]
+        self.blackKingLocation = kings["bK"][0]
+        self.whiteToMove = whiteToMove
+        self.castlingRights = castlingRights
+        self.enPassantPossible = enPassantPossible
+        self.halfmoveClock = int(fields[4])
+        self.fullmoveNumber = int(fields[5])
+        
+        #Moves before this position are unknown
+        self.moveLog = []
+        self.castlingRightsLog = []
+        self.enPassantLog = []
+        self.halfmoveClockLog = []
+        self.zobristKey = hash_position(self)
+        self.zobristKeyLog = []
+        self.positionCounts = {self.zobristKey: 1}
+        self.movesCacheKey = None
+        self.checkCacheKey = None
+        self.snapshots = []
+        
+    def to_fen(self):
+    
+        #FEN string of the current position
+        
+        rows = []
+        for row in range(8):
+            fen_row = ""
+            empty = 0
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty > 0:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += PIECES_FEN[piece[1]] if piece[0] == 'w' else PIECES_FEN[piece[1]].lower()
+            if empty > 0:
+                fen_row += str(empty)
+            rows.append(fen_row)
+            
+        castling = "".join(char for char in "KQkq" if self.castlingRights & FEN_CASTLING[char]) or "-"
+        en_passant = "-"
+        if self.enPassantPossible:
+            en_passant = Move.colToFile[self.enPassantPossible[1]] + Move.rowToRank[self.enPassantPossible[0]]
+        return " ".join(("/".join(rows), "w" if self.whiteToMove else "b", castling, en_passant,
+            str(self.halfmoveClock), str(self.fullmoveNumber)))
+        
+    def snapshot(self):
+    
+        #Immutable copy of the current position (Without the moves that led to it)
+        
+        board = bytes([SNAPSHOT_CODES[piece] for row in self.board for piece in row])
+        enPassant = self.enPassantPossible[0] * 8 + self.enPassantPossible[1] + 1 if self.enPassantPossible else 0
+        state = (self.whiteToMove | self.castlingRights << 1 | enPassant << 5 | self.halfmoveClock << 12
+            | self.fullmoveNumber << 28)
+        return Snapshot(board, state, self.zobristKey)
+        
+    @classmethod
+    def from_snapshot(cls, snapshot, history=()):
+    
+        #Create a game that starts from a snapshot (See set_snapshot)
+        
+        state = cls()
+        state.set_snapshot(snapshot, history)
+        return state
+        
+    def set_snapshot(self, snapshot, history=()):
+    
+        #Set up the position of a snapshot, like set_fen
+        #history: Zobrist keys of the positions before it, so repetitions of them are still detected
+        
+        self.loadSnapshot(snapshot)
+        self.moveLog = []
+        self.castlingRightsLog = []
+        self.enPassantLog = []
+        self.halfmoveClockLog = []
+        self.zobristKeyLog = []
+        self.positionCounts = {}
+        for key in history:
+            self.positionCounts[key] = self.positionCounts.get(key, 0) + 1
+        self.positionCounts[self.zobristKey] = self.positionCounts.get(self.zobristKey, 0) + 1
+        self.snapshots = []
+        
+    def loadSnapshot(self, snapshot):
+    
+        #Only the position itself: Board, King locations, side to move, castling rights, En passant square, counters and hash
+        
+        board = self.board
+        for sq in range(64):
+            board[sq >> 3][sq & 7] = SNAPSHOT_PIECES[snapshot.board[sq]]
+        whiteKing = snapshot.board.find(SNAPSHOT_CODES["wK"])
+        blackKing = snapshot.board.find(SNAPSHOT_CODES["bK"])
+        self.whiteKingLocation = (whiteKing >> 3, whiteKing & 7)
+        self.blackKingLocation = (blackKing >> 3, blackKing & 7)
+        
+        state = snapshot.state
+        self.whiteToMove = bool(state & 1)
+        self.castlingRights = state >> 1 & 15
+        enPassant = state >> 5 & 127
+        self.enPassantPossible = ((enPassant - 1) >> 3, (enPassant - 1) & 7) if enPassant else ()
+        self.halfmoveClock = state >> 12 & 0xFFFF
+        self.fullmoveNumber = state >> 28
+        self.zobristKey = snapshot.key
+        
+    def push_snapshot(self):
+    
+        #Save the position, so pop_snapshot can go back to it after any number of make_move
+        #(Copy-make instead of undoing every move)
+        
+        self.snapshots.append((self.snapshot(), len(self.moveLog)))
+        
+    def pop_snapshot(self):
+    
+        #Go back to the position of the last push_snapshot and forget the moves made since then
+        
+        snapshot, moves = self.snapshots.pop()
+        if len(self.moveLog) < moves:
+            raise ValueError("Moves were undone past the snapshot")
+        if len(self.moveLog) > moves:
+            #Positions after the snapshot don't count for repetitions anymore
+            for key in self.zobristKeyLog[moves + 1:] + [self.zobristKey]:
+                count = self.positionCounts[key]
+                if count > 1:
+                    self.positionCounts[key] = count - 1
+                else: del self.positionCounts[key]
+            del self.moveLog[moves:]
+            del self.castlingRightsLog[moves:]
+            del self.enPassantLog[moves:]
+            del self.halfmoveClockLog[moves:]
+            del self.zobristKeyLog[moves:]
+        self.loadSnapshot(snapshot)
+        
     def make_move(self, move):
         
         #Add move to list
         self.moveLog.append(move)
+        enPassantKey = en_passant_key(self)
     
         #Move piece from start square to end square
         self.board[move.start[0]][move.start[1]] = "--"
@@ -49,10 +385,9 @@ class GameState():
                 if self.whiteToMove:
                     self.board[move.end[0]+1][move.end[1]] = "--"
                 else: self.board[move.end[0]-1][move.end[1]] = "--"
-            #If move was pawn promotion: Replace pawn with Queen
-            #To-Do: Enable players to choose to which piece the pawn is promoted
-            if move.end[0] == 0 or move.end[0] == 7:
-                self.board[move.end] = move.pieceMoved[0] + 'Q'
+            #If move was pawn promotion: Replace pawn with the piece chosen (Queen unless the move says otherwise)
+            if move.promotionPiece:
+                self.board[move.end[0]][move.end[1]] = move.pieceMoved[0] + move.promotionPiece
         
         #If King was moved: Update king location
         if move.pieceMoved[1] == 'K':
@@ -60,9 +395,24 @@ class GameState():
                 self.blackKingLocation = move.end
             else: self.whiteKingLocation = move.end
         
-        #Update Kings and Rooks moved
+        #Update En passant square: Only possible right after a Pawn moved two squares
+        self.enPassantLog.append(self.enPassantPossible)
+        if move.pieceMoved[1] == 'p' and abs(move.start[0] - move.end[0]) == 2:
+            self.enPassantPossible = ((move.start[0] + move.end[0]) // 2, move.start[1])
+        else: self.enPassantPossible = ()
+        
+        #Update move counters: Captures and Pawn moves reset the halfmove clock
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else: self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+        
+        #Update castling rights
         #Previously there was a bug where a player could Castle with a Rook that was captured the turn before
-        self.updatePiecesMoved()
+        self.castlingRightsLog.append(self.castlingRights)
+        self.updateCastlingRights(move)
         
         #If move was Castle: Set Rook to the square to the left/right (Depending on long/short Castle) of end square
         if move.pieceMoved[1] == 'K':
@@ -76,6 +426,36 @@ class GameState():
         #Switch who's turn it is
         self.whiteToMove = not self.whiteToMove
         
+        #Update position hash
+        self.zobristKeyLog.append(self.zobristKey)
+        self.updateZobristKey(move, self.castlingRightsLog[-1], enPassantKey)
+        self.positionCounts[self.zobristKey] = self.positionCounts.get(self.zobristKey, 0) + 1
+        
+    def updateZobristKey(self, move, castlingRights, enPassantKey):
+    
+        #XOR out what the move changed and XOR in the new state
+        #castlingRights and enPassantKey are from before the move, everything else is already updated
+        
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        start = move.start[0] * 8 + move.start[1]
+        end = move.end[0] * 8 + move.end[1]
+        
+        #The piece on the end square can differ from the piece moved (Pawn promotion)
+        key ^= ZOBRIST_PIECES[move.pieceMoved][start] ^ ZOBRIST_PIECES[self.board[move.end[0]][move.end[1]]][end]
+        if move.pieceCaptured != "--":
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][end]
+        elif move.pieceMoved[1] == 'p' and move.start[1] != move.end[1]:
+            enemyPawn = 'bp' if move.pieceMoved[0] == 'w' else 'wp'
+            key ^= ZOBRIST_PIECES[enemyPawn][move.start[0] * 8 + move.end[1]]
+        elif move.pieceMoved[1] == 'K' and move.start[1] < move.end[1]-1:
+            key ^= ZOBRIST_PIECES[move.pieceMoved[0] + 'R'][end+1] ^ ZOBRIST_PIECES[move.pieceMoved[0] + 'R'][end-1]
+        elif move.pieceMoved[1] == 'K' and move.start[1] > move.end[1]+1:
+            key ^= ZOBRIST_PIECES[move.pieceMoved[0] + 'R'][end-2] ^ ZOBRIST_PIECES[move.pieceMoved[0] + 'R'][end+1]
+            
+        key ^= ZOBRIST_CASTLING[castlingRights] ^ ZOBRIST_CASTLING[self.castlingRights]
+        key ^= enPassantKey ^ en_passant_key(self)
+        self.zobristKey = key
+        
     def undo_move(self):
     
         #Mirror of make_move
@@ -99,11 +479,20 @@ class GameState():
                     else: self.board[last_move.end[0]+1][last_move.end[1]] = "bp"
                     
                 #If last move was pawn promotion: Replace promoted piece with pawn
-                if last_move.end[0] == 0 or last_move.end[0] == 7:
-                    self.board[last_move.start] = last_move.pieceMoved[0] + 'p'
+                if last_move.promotionPiece:
+                    self.board[last_move.start[0]][last_move.start[1]] = last_move.pieceMoved[0] + 'p'
                     
-            #Update Kings and Rooks moved
-            self.updatePiecesMoved()
+            #Restore castling rights, En passant square and move counters from before the move
+            self.castlingRights = self.castlingRightsLog.pop()
+            self.enPassantPossible = self.enPassantLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog.pop()
+            count = self.positionCounts[self.zobristKey]
+            if count > 1:
+                self.positionCounts[self.zobristKey] = count - 1
+            else: del self.positionCounts[self.zobristKey]
+            self.zobristKey = self.zobristKeyLog.pop()
+            if self.whiteToMove:
+                self.fullmoveNumber -= 1
                     
             if last_move.pieceMoved[1] == 'K':
                 
@@ -125,24 +514,228 @@ class GameState():
         
     def valid_moves(self):
     
-        #Idea: Generate all possible moves for every (White/Black) piece
-        #Then check for every possible move, if that move leaves the player in Check (Not valid!)
+        #Valid moves are only generated once per position and then remembered
+        #The cache is keyed by the position hash, which every make_move/undo_move changes
+        #Returns a copy, so callers can sort or change the list
         
-        moves = self.possible_moves()
+        if self.movesCacheKey != self.zobristKey:
+            self.cachedMoves = self.generateValidMoves()
+            self.movesCacheKey = self.zobristKey
+        return list(self.cachedMoves)
+
+    def valid_captures(self):
+
+        #Only the valid moves that capture a piece (Including En passant)
+
+        return self.validMovesOfKind(True)
+
+    def valid_quiet_moves(self):
+
+        #Only the valid moves that don't capture anything
+
+        return self.validMovesOfKind(False)
+
+    def validMovesOfKind(self, captures):
+
+        #If all valid moves of the position are known already they are filtered, otherwise the backend generates only the moves asked for
+
+        if self.movesCacheKey == self.zobristKey:
+            return [move for move in self.cachedMoves if (move.moveID & MOVE_CAPTURE != 0) == captures]
+        return self.generateValidMovesOfKind(captures)
+
+    def generateValidMovesOfKind(self, captures):
+
+        #This move generator can't skip moves, so all valid moves are generated (and cached for the other kind) and filtered
+
+        self.valid_moves()
+        return self.validMovesOfKind(captures)
+
+    def get_valid_move(self, moveID):
+
+        #The valid move with this moveID in the current position, or None
+        #Used to check moves that come from another position, like the best move stored in the transposition table
+
+        if self.movesCacheKey == self.zobristKey:
+            moves = self.cachedMoves
+        else: moves = self.generateValidMovesFrom(moveID & 63)
+        for move in moves:
+            if move.moveID == moveID:
+                return move
+        return None
+
+    def generateValidMovesFrom(self, square):
+
+        #Valid moves of the piece on square (row * 8 + col). Here: All valid moves, cached
+
+        self.valid_moves()
+        return self.cachedMoves
+
+    def generateValidMoves(self):
+    
+        #Idea: Find all enemy pieces that give Check and all own pieces that are pinned to the King, once per position
+        #Then go through all possible moves and only keep the ones that don't leave the King in Check
+        #The board is never changed, so this only costs as much as generating the possible moves
         
-        #Go through move list in reverse order to not mess up indexing when removing moves
-        for i in range(len(moves)-1, -1, -1):
+        king_location = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        pins, checks = self.checkForPinsAndChecks(king_location)
         
-            #For every possible move: Make the move. Then check if it leaves the player in Check
-            #If yes: Remove this move from the list. Then undo the move
-            self.make_move(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undo_move()
+        #If the King is in Check by one piece: Other pieces have to capture that piece or block its line of sight
+        #If the King is in Check by two pieces: Only the King can move
+        check_squares = None
+        if len(checks) == 1:
+            check_row, check_col, direction = checks[0]
+            check_squares = [(check_row, check_col)]
+            if direction is not None:
+                for i in range(1, 8):
+                    square = (king_location[0] + direction[0] * i, king_location[1] + direction[1] * i)
+                    if square == (check_row, check_col):
+                        break
+                    check_squares.append(square)
+        
+        moves = []
+        for move in self.possible_moves():
+        
+            #King moves: The end square must not be attacked
+            if move.pieceMoved[1] == 'K':
+                if not self.squareUnderAttack(move.end[0], move.end[1]):
+                    moves.append(move)
+                continue
+                
+            if len(checks) > 1:
+                continue
+                
+            #Pinned pieces can only move along the line between King and pinning piece
+            if move.start in pins:
+                direction = pins[move.start]
+                if (move.end[0] - move.start[0]) * direction[1] != (move.end[1] - move.start[1]) * direction[0]:
+                    continue
+                    
+            if move.pieceMoved[1] == 'p' and move.pieceCaptured == "--" and move.end[1] != move.start[1]:
+                if not self.enPassantLegal(move, king_location, check_squares):
+                    continue
+            elif check_squares is not None and move.end not in check_squares:
+                continue
+            moves.append(move)
         return moves
         
+    def checkForPinsAndChecks(self, king_location):
+    
+        #Look from the King in every direction
+        #If the first piece in a direction is an enemy piece that can move towards the King, it gives Check
+        #If the first piece is an own piece and the second one is such an enemy piece, the own piece is pinned
+        #Returns the pinned pieces (square -> direction) and the checking pieces (row, col, direction)
+        
+        pins = {}
+        checks = []
+        ownColor = 'w' if self.whiteToMove else 'b'
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        pawnDirection = -1 if self.whiteToMove else 1
+        
+        #First four directions are straight (Rook), last four diagonal (Bishop)
+        directions = ((-1,0), (0,-1), (1,0), (0,1), (-1,-1), (-1,1), (1,-1), (1,1))
+        for j, d in enumerate(directions):
+            possible_pin = None
+            for i in range(1, 8):
+                row = king_location[0] + d[0] * i
+                col = king_location[1] + d[1] * i
+                if not (0 <= row < 8 and 0 <= col < 8):
+                    break
+                piece = self.board[row][col]
+                if piece[0] == ownColor:
+                    if possible_pin is not None:
+                        break
+                    possible_pin = (row, col)
+                elif piece[0] == enemyColor:
+                    if ((j < 4 and piece[1] in "RQ") or (j >= 4 and piece[1] in "BQ")
+                        or (i == 1 and piece[1] == 'p' and d[0] == pawnDirection and j >= 4)):
+                        if possible_pin is None:
+                            checks.append((row, col, d))
+                        else: pins[possible_pin] = d
+                    break
+                    
+        knightMoves = ((-2,-1), (-2,1), (2,-1), (2,1), (-1,-2), (-1,2), (1,-2), (1,2))
+        for d in knightMoves:
+            row = king_location[0] + d[0]
+            col = king_location[1] + d[1]
+            if 0 <= row < 8 and 0 <= col < 8 and self.board[row][col] == enemyColor + 'N':
+                checks.append((row, col, None))
+                
+        return pins, checks
+        
+    def squareUnderAttack(self, row, col):
+    
+        #Check if any enemy piece attacks the square
+        #The own King is ignored, so it can't block an attack on a square it is moving to
+        
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        king_location = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        return self.squareAttacked(row, col, enemyColor, king_location)
+        
+    def squareAttacked(self, row, col, color, ignore=None):
+    
+        #Check if a piece of color attacks the square (See square_attacked)
+        #ignore: A square that counts as empty
+        
+        return square_attacked(self.board, row, col, color, ignore)
+        
+    def attackMap(self, color):
+    
+        #All squares attacked by the pieces of color, as a bitboard (Bit row * 8 + col)
+        #Squares with own pieces count as attacked (They are defended)
+        
+        board = self.board
+        attacks = 0
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != color:
+                    continue
+                kind = piece[1]
+                if kind == 'N':
+                    squares = KNIGHT_SQUARES[row][col]
+                elif kind == 'K':
+                    squares = KING_SQUARES[row][col]
+                elif kind == 'p':
+                    #The squares a Pawn attacks are the squares from which an enemy Pawn would attack it
+                    squares = PAWN_ATTACKER_SQUARES['b' if color == 'w' else 'w'][row][col]
+                else:
+                    lines = ()
+                    if kind in "RQ":
+                        lines += ROOK_LINES[row][col]
+                    if kind in "BQ":
+                        lines += BISHOP_LINES[row][col]
+                    for line in lines:
+                        for r, c in line:
+                            attacks |= 1 << (r * 8 + c)
+                            if board[r][c] != "--":
+                                break
+                    continue
+                for r, c in squares:
+                    attacks |= 1 << (r * 8 + c)
+        return attacks
+        
+    def enPassantLegal(self, move, king_location, check_squares):
+    
+        #En passant removes two Pawns from the same row, which the pin check doesn't cover
+        
+        captured = (move.start[0], move.end[1])
+        
+        #If in Check: The captured Pawn has to be the checking piece, or the end square has to block the Check
+        if check_squares is not None and move.end not in check_squares and captured not in check_squares:
+            return False
+            
+        #If the King is on the same row: Look past both Pawns for an enemy Rook or Queen
+        if king_location[0] == move.start[0]:
+            enemyColor = 'b' if self.whiteToMove else 'w'
+            step = 1 if move.start[1] > king_location[1] else -1
+            col = king_location[1] + step
+            while 0 <= col < 8:
+                if col != move.start[1] and col != captured[1] and self.board[move.start[0]][col] != "--":
+                    piece = self.board[move.start[0]][col]
+                    return not (piece[0] == enemyColor and piece[1] in "RQ")
+                col += step
+        return True
+        
     def possible_moves(self):
     
         moves = []
@@ -176,12 +769,11 @@ class GameState():
     
         moveDirection = -1 if self.whiteToMove else 1
         startRow = 6 if self.whiteToMove else 1
-        enPassantRow = 3 if self.whiteToMove else 4
         enemyColor = 'b' if self.whiteToMove else 'w'
-
+        
         #Single square forward
         if self.board[row + moveDirection][col] == "--":
-            moves.append(Move((row, col), (row + moveDirection, col), self.board))
+            self.addPawnMove((row, col), (row + moveDirection, col), moves)
                 
             #Two squares forward (Only if pawn hasn't moved yet)
             if row == startRow and self.board[row + (2*moveDirection)][col] == "--":
@@ -189,18 +781,26 @@ class GameState():
                     
         #Capture: Pawn can move one square diagonally up, if that square contains enemy piece
         if col > 0 and self.board[row + moveDirection][col-1][0] == enemyColor:
-            moves.append(Move((row, col), (row + moveDirection, col-1), self.board))
+            self.addPawnMove((row, col), (row + moveDirection, col-1), moves)
         if col < 7 and self.board[row + moveDirection][col+1][0] == enemyColor:
-            moves.append(Move((row, col), (row + moveDirection, col+1), self.board))
+            self.addPawnMove((row, col), (row + moveDirection, col+1), moves)
                 
         #En passant: If an enemy pawn went two squares forward to pass this pawn in the previous turn:
         #Pawn can capture enemy pawn by moving one square diagonally up
-        if (row == enPassantRow and self.moveLog[-1].pieceMoved == enemyColor + 'p'
-            and self.moveLog[-1].start[0] == 7 - startRow):
-            if col > 0 and self.moveLog[-1].end == (row, col-1):
+        if self.enPassantPossible:
+            if col > 0 and self.enPassantPossible == (row + moveDirection, col-1):
                 moves.append(Move((row,col), (row + moveDirection, col-1), self.board))
-            if col < 7 and self.moveLog[-1].end == (row, col+1):
+            if col < 7 and self.enPassantPossible == (row + moveDirection, col+1):
                 moves.append(Move((row,col), (row + moveDirection, col+1), self.board))
+                
+    def addPawnMove(self, start, end, moves):
+    
+        #A Pawn reaching the last row can be promoted to any of the PROMOTION_PIECES, each is its own move
+        
+        if end[0] == 0 or end[0] == 7:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(start, end, self.board, piece))
+        else: moves.append(Move(start, end, self.board))
         
     def getRookMoves(self, row, col, moves):
     
@@ -232,10 +832,10 @@ class GameState():
                 end = (row + d[0] * i, col + d[1] * i)
                 if 0 <= end[0] < 8 and 0 <= end[1] < 8:
                     if self.board[end[0]][end[1]] == "--":
-                        moves.append(Move((row, col), (end[0], end[1]), self.board))
+                        moves.append(Move((row, col), end, self.board))
                         continue
                     elif self.board[end[0]][end[1]][0] == enemyColor:
-                        moves.append(Move((row, col), (end[0], end[1]), self.board))
+                        moves.append(Move((row, col), end, self.board))
                 break
         
     def getKnightMoves(self, row, col, moves):
@@ -248,7 +848,7 @@ class GameState():
             end = (row + d[0], col + d[1])
             if 0 <= end[0] < 8 and 0 <= end[1] < 8:
                 if self.board[end[0]][end[1]][0] != ownColor:
-                    moves.append(Move((row, col), (end[0], end[1]), self.board))
+                    moves.append(Move((row, col), end, self.board))
                 
         
     def getKingMoves(self, row, col, moves):
@@ -262,20 +862,18 @@ class GameState():
             end = (row + d[0], col + d[1])
             if 0 <= end[0] < 8 and 0 <= end[1] < 8:
                 #King can't move to a square that is adjacent to enemy King's square
-                if (self.board[end[0]][end[1]][0] != ownColor and (np.abs(end[0] - enemyKingLocation[0]) > 1
-                    or np.abs(end[1] - enemyKingLocation[1]) > 1)):
-                    moves.append(Move((row, col), (end[0], end[1]), self.board))
+                if (self.board[end[0]][end[1]][0] != ownColor and (abs(end[0] - enemyKingLocation[0]) > 1
+                    or abs(end[1] - enemyKingLocation[1]) > 1)):
+                    moves.append(Move((row, col), end, self.board))
                     
         #Castling: If King is not in Check and King hasn't moved:
         #If left Rook hasn't moved: Long castle possible. If right Rook hasn't moved: Short Castle possible
         left_castle_possible = False
         right_castle_possible = False
         if not self.inCheck():
-            if ((self.whiteToMove and not self.whiteKingMoved and not self.leftWhiteRookMoved)
-                or (not self.whiteToMove and not self.blackKingMoved and not self.leftBlackRookMoved)):
+            if self.castlingRights & (CASTLE_WHITE_LONG if self.whiteToMove else CASTLE_BLACK_LONG):
                 left_castle_possible = True
-            if ((self.whiteToMove and not self.whiteKingMoved and not self.rightWhiteRookMoved)
-                or (not self.whiteToMove and not self.blackKingMoved and not self.rightBlackRookMoved)):
+            if self.castlingRights & (CASTLE_WHITE_SHORT if self.whiteToMove else CASTLE_BLACK_SHORT):
                 right_castle_possible = True
             self.castle(row, col, left_castle_possible, right_castle_possible, moves)
             
@@ -288,78 +886,108 @@ class GameState():
         for direction in move_directions:
             castle_possible = left_castle_possible if direction == -1 else right_castle_possible
             
-            #Check if pieces are in the way
+            #Check if pieces are in the way (Long Castle also needs the square next to the Rook to be empty)
             if (castle_possible and self.board[row][col + direction] == "--"
-                and self.board[row][col + (direction * 2)] == "--"):
+                and self.board[row][col + (direction * 2)] == "--"
+                and (direction == 1 or self.board[row][col + (direction * 3)] == "--")):
                 
-                #Move the King one square to the left/right and check if he's in Check. Then move him back.
-                self.make_move(Move((row, col), (row, col + direction), self.board))
-                self.whiteToMove = not self.whiteToMove
-                if self.inCheck():
-                    castle_possible = False
-                self.whiteToMove = not self.whiteToMove
-                self.undo_move()
-                
-                if castle_possible:
+                #Check if the square the King moves through is attacked
+                #(valid_moves checks the end square like for every other King move)
+                if castle_possible and not self.squareUnderAttack(row, col + direction):
                     moves.append(Move((row, col), (row, col + (direction * 2)), self.board))
                     
                     
     def inCheck(self):
     
-        #Idea: Let King move like every piece
-        #If he can reach an enemy piece when moving as that piece, he's in that enemy piece's direct line of sight
-        #If the King is in direct line of sight of any enemy piece, he's in Check
-        moves = []
-        pieces = ['p', 'R', 'N', 'B', 'Q']
+        #Remembered per position like the valid moves
+        
+        if self.checkCacheKey != self.zobristKey:
+            self.cachedCheck = self.kingInCheck()
+            self.checkCacheKey = self.zobristKey
+        return self.cachedCheck
+        
+    def kingInCheck(self):
+    
+        #The King is in Check if an enemy piece attacks his square
+        
         king_location = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
-        enemyColor = 'b' if self.whiteToMove else 'w'
-            
-        for piece in pieces:
-            self.getPieceMoves(piece, king_location[0], king_location[1], moves)
-            for move in moves:
-                if self.board[move.end[0]][move.end[1]] == enemyColor + piece:
-                    return True
-            moves = []
-        return False
+        return self.squareAttacked(king_location[0], king_location[1], 'b' if self.whiteToMove else 'w')
         
     def checkMate(self):
         
         #Checkmate if player has no valid moves and his King is in Check
-        return len(self.valid_moves()) == 0 and self.inCheck()
+        return self.gameResult() == GameResult.CHECKMATE
         
     def staleMate(self):
     
         #Stalemate if player has no valid moves, but his King is not in Check
-        return len(self.valid_moves()) == 0 and not self.inCheck()
+        return self.gameResult() == GameResult.STALEMATE
+        
+    def gameResult(self):
+    
+        #How the game stands after the last move. A Checkmate counts even if it happens on the fiftieth move
+        #Uses the cached valid moves and check status, so asking again costs nothing
+        
+        if self.movesCacheKey != self.zobristKey:
+            self.valid_moves()
+        if len(self.cachedMoves) == 0:
+            return GameResult.CHECKMATE if self.inCheck() else GameResult.STALEMATE
+        if self.threefoldRepetition():
+            return GameResult.REPETITION
+        if self.fiftyMoveRule():
+            return GameResult.FIFTY_MOVE_RULE
+        return GameResult.ONGOING
         
               
-    def updatePiecesMoved(self):
-    
-        #Go through entire move list. If a King or Rook was moved or a Rook was captured, set it to Moved
-    
-        self.whiteKingMoved = False
-        self.blackKingMoved = False
-        self.leftWhiteRookMoved = False
-        self.rightWhiteRookMoved = False
-        self.leftBlackRookMoved = False
-        self.rightBlackRookMoved = False
-        
-        for move in self.moveLog:
-            if move.pieceMoved == "wK":
-                self.whiteKingMoved = True
-            elif move.pieceMoved == "bK":
-                self.blackKingMoved = True
-            elif move.pieceMoved == "wR" or move.pieceCaptured == "wR":
-                if move.start == (7,0) or move.end == (7,0):
-                    self.leftWhiteRookMoved = True
-                elif move.start == (7,7) or move.end == (7,7):
-                    self.rightWhiteRookMoved = True
-            elif move.pieceMoved == "bR" or move.pieceCaptured == "bR":
-                if move.start == (0,0) or move.end == (0,0):
-                    self.leftBlackRookMoved = True
-                elif move.start == (0,7) or move.end == (0,7):
-                    self.rightBlackRookMoved = True
+    def repetitions(self):
+    
+        #How often the current position occurred in this game, including now
         
+        return self.positionCounts[self.zobristKey]
+        
+    def threefoldRepetition(self):
+    
+        #Draw if the same position occurred three times
+        
+        return self.positionCounts[self.zobristKey] >= 3
+        
+    def fiftyMoveRule(self):
+    
+        #Draw if both players made 50 moves without a capture or a Pawn move
+        
+        return self.halfmoveClock >= 100
+        
+    def updateCastlingRights(self, move):
+    
+        #If a King or Rook moves away from its starting square or a Rook is captured on it, the rights of that piece are lost
+        
+        self.castlingRights &= CASTLING_RIGHTS_KEPT[move.start[0]][move.start[1]] & CASTLING_RIGHTS_KEPT[move.end[0]][move.end[1]]
+        
+def get_backend(name):
+
+    #Return the GameState class of a move generation backend
+    #Both backends share the GameState/Move API, "bitboard" is a lot faster
+    
+    if name == "mailbox":
+        return GameState
+    if name == "bitboard":
+        from bitboard import BitboardGameState
+        return BitboardGameState
+    raise ValueError("Unknown backend: " + name)
+        
+#Pieces a Pawn can be promoted to, and their code in Move.moveID
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+PROMOTION_CODES = {"": 0, 'Q': 1, 'R': 2, 'B': 3, 'N': 4}
+
+#Shared (row, col) tuples and piece names, so moves don't keep their own copies
+SQUARES = [[(row, col) for col in range(8)] for row in range(8)]
+PIECE_NAMES = {name: name for name in ("--", "wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")}
+
+#Move.moveID: Start square (Bits 0-5), end square (Bits 6-11), promotion piece (Bits 12-14) and flags
+MOVE_CAPTURE = 1 << 15
+MOVE_EN_PASSANT = 1 << 16
+MOVE_CASTLE = 1 << 17
+
 class Move():
 
     #Lookup to easily match rows and columns to the corresponding ranks and files of the Chess board (and vice versa)
@@ -370,31 +998,56 @@ class Move():
     fileToCol = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colToFile = {col: file for file, col in fileToCol.items()}
     
-    def __init__(self, start, end, board):
+    #Thousands of moves are generated per position in a search, so they don't get a __dict__
+    __slots__ = ("start", "end", "pieceMoved", "pieceCaptured", "promotionPiece", "moveID")
+    
+    def __init__(self, start, end, board, promotionPiece='Q'):
     
-        self.start = start
-        self.end = end
-        self.pieceMoved = board[start[0]][start[1]]
-        self.pieceCaptured = board[end[0]][end[1]]
+        startRow, startCol = start
+        endRow, endCol = end
+        self.start = SQUARES[startRow][startCol]
+        self.end = SQUARES[endRow][endCol]
+        self.pieceMoved = pieceMoved = PIECE_NAMES[board[startRow][startCol]]
+        self.pieceCaptured = pieceCaptured = PIECE_NAMES[board[endRow][endCol]]
+        
+        #Everything that identifies the move packed into one integer, used for comparing and hashing moves
+        moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
+        if pieceCaptured != "--":
+            moveID |= MOVE_CAPTURE
+        if pieceMoved[1] == 'p':
+            if endRow == 0 or endRow == 7:
+                moveID |= PROMOTION_CODES[promotionPiece] << 12
+            else: promotionPiece = ""
+            if startCol != endCol and pieceCaptured == "--":
+                moveID |= MOVE_EN_PASSANT | MOVE_CAPTURE
+        else:
+            promotionPiece = ""
+            if pieceMoved[1] == 'K' and (startCol - endCol == 2 or endCol - startCol == 2):
+                moveID |= MOVE_CASTLE
+        self.promotionPiece = promotionPiece
+        self.moveID = moveID
         
     def __eq__(self, other):
     
         #override equals method to compare moves
         
         if isinstance(other, Move):
-            if self.start == other.start and self.end == other.end:
-                return True
+            return self.moveID == other.moveID
         return False
         
+    def __hash__(self):
+        return self.moveID
+        
     def get_notation(self):
     
         #Chess notation:
             #Start with abbreviation of piece moved, except if it's a pawn
             #If move was a capture: Add an "x". If the piece moved was a pawn, also add its starting file
             #Add the square the piece was moved to
-            #If move was pawn promotion (to Queen): Add "=Q"
+            #If move was pawn promotion: Add "=" and the new piece, e.g. "=Q"
             
             #Special notation: If move was short Castle: "O-O". If move was long castle: "O-O-O"
+            #(No disambiguation or check marks: pgn.move_to_san gives the full SAN)
             
         notation = ""
         
@@ -407,8 +1060,8 @@ class Move():
         
         notation += self.get_square(self.end[0], self.end[1])
         
-        if self.pieceMoved[1] == 'p' and (self.end[0] == 0 or self.end[0] == 7):
-            notation += "=Q"
+        if self.promotionPiece:
+            notation += "=" + self.promotionPiece
         
         if self.pieceMoved[1] == 'K':
             if self.start[1] < self.end[1]-1:
@@ -418,6 +1071,12 @@ class Move():
                 
         return notation
         
+    def get_uci_notation(self):
+    
+        #Long algebraic notation as used by UCI: Start and end square, plus the promotion piece, e.g. "e2e4" or "e7e8q"
+        
+        return self.get_square(self.start[0], self.start[1]) + self.get_square(self.end[0], self.end[1]) + self.promotionPiece.lower()
+        
     def get_square(self, row, col):
         return self.get_file(col) + self.get_rank(row)
        
@@ -0,0 +1,133 @@
+from itertools import chain
+import numpy as np
+
+#Static evaluation of a position: Material plus a bonus/malus for the square every piece stands on
+#Scores are in centipawns (A Pawn is worth 100)
+
+PIECE_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+#Piece-square tables from White's point of view, row by row like GameState.board (First row is rank 8)
+#For Black the table is mirrored vertically
+PIECE_SQUARE_TABLES = {
+    'p': (
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0),
+    'N': (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    'B': (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    'R': (
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0),
+    'Q': (
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20),
+    'K': (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20),
+}
+
+#Value of every piece on every square, e.g. PIECE_SQUARE_VALUES["bN"][row * 8 + col]
+PIECE_SQUARE_VALUES = {}
+for piece, table in PIECE_SQUARE_TABLES.items():
+    PIECE_SQUARE_VALUES['w' + piece] = tuple(PIECE_VALUES[piece] + table[sq] for sq in range(64))
+    PIECE_SQUARE_VALUES['b' + piece] = tuple(PIECE_VALUES[piece] + table[(7 - sq // 8) * 8 + sq % 8] for sq in range(64))
+
+def evaluate(state):
+
+    #Score of the position from the point of view of the player whose turn it is
+
+    score = 0
+    for row in range(8):
+        board_row = state.board[row]
+        for col in range(8):
+            piece = board_row[col]
+            if piece != "--":
+                if piece[0] == 'w':
+                    score += PIECE_SQUARE_VALUES[piece][row * 8 + col]
+                else: score -= PIECE_SQUARE_VALUES[piece][row * 8 + col]
+    return score if state.whiteToMove else -score
+
+#Batch evaluation: Many positions are encoded as one array and scored with a single NumPy call
+#Used for scoring lots of positions at once (e.g. labelling data sets), evaluate is faster for a single position
+#
+#   planes = encode_positions(states)
+#   scores = evaluate_encoded(planes, np.array([state.whiteToMove for state in states]))
+
+#Order of the piece planes
+PIECES = ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+PIECE_CODES = {piece: i for i, piece in enumerate(PIECES)}
+PIECE_CODES["--"] = len(PIECES)
+SORTED_PIECE_NAMES = np.array(sorted(PIECE_CODES))
+SORTED_PIECE_CODES = np.array([PIECE_CODES[piece] for piece in SORTED_PIECE_NAMES], dtype=np.int8)
+PIECE_PLANES = np.arange(len(PIECES), dtype=np.int8).reshape(1, len(PIECES), 1)
+
+#PIECE_SQUARE_WEIGHTS[piece, square]: PIECE_SQUARE_VALUES as one (12, 64) array, negative for Black
+PIECE_SQUARE_WEIGHTS = np.array([PIECE_SQUARE_VALUES[piece] for piece in PIECES], dtype=np.int32)
+PIECE_SQUARE_WEIGHTS[6:] *= -1
+
+def encode_positions(states):
+
+    #(N, 12, 64) array of zeros and ones: planes[n, piece, square] is 1 if that piece stands on square in position n
+    #Pieces in the order of PIECES, squares are row * 8 + col
+    #The boards are turned into one array of piece codes (12 for an empty square), which NumPy compares with every piece at once
+
+    if not isinstance(states, list):
+        states = list(states)
+    if states and isinstance(states[0].board, np.ndarray):
+        #NumPy boards (mailbox backend): Look up the codes of all squares at once
+        codes = SORTED_PIECE_CODES[np.searchsorted(SORTED_PIECE_NAMES, np.array([state.board for state in states]))]
+    else:
+        codes = np.fromiter(map(PIECE_CODES.__getitem__, chain.from_iterable(chain.from_iterable(state.board for state in states))),
+            dtype=np.int8, count=len(states) * 64)
+    return (codes.reshape(len(states), 1, 64) == PIECE_PLANES).view(np.uint8)
+
+def evaluate_encoded(planes, white_to_move):
+
+    #Scores of all encoded positions, each from the point of view of the player whose turn it is (Same as evaluate)
+
+    scores = np.tensordot(planes.astype(np.int32), PIECE_SQUARE_WEIGHTS, axes=((1, 2), (0, 1)))
+    return np.where(white_to_move, scores, -scores)
+
+def evaluate_batch(states):
+    #states can be a generator: It is turned into a list once, encode_positions then uses that list as it is
+    states = list(states)
+    return evaluate_encoded(encode_positions(states), np.array([state.whiteToMove for state in states], dtype=bool))
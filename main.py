@@ -1,28 +1,53 @@
+import os
 import pygame as game
 import numpy as np
-from engine import GameState
+from engine import get_backend
+from engine import GameResult
 from engine import Move
+from pgn import move_to_san
+from book import OpeningBook
+from search import Searcher
+from tablebase import Tablebase
+from worker import EngineWorker
 
 #Declare size of window and divide it into 64 squares of equal size
 WIDTH = HEIGHT = 512
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
 
-MAX_FPS = 15
+#Upper limit for redraws. The screen is only redrawn when something changed, so an idle game uses no CPU
+MAX_FPS = 60
+
+#Move generation backend: "bitboard" or "mailbox"
+BACKEND = "bitboard"
+
+#Which colors the computer plays, and how many seconds it may think per move
+COMPUTER_PLAYS_WHITE = False
+COMPUTER_PLAYS_BLACK = True
+COMPUTER_MOVE_TIME = 1.0
+
+#Opening book of the computer (Built with book.py), not used if the file doesn't exist
+BOOK_PATH = "book.bin"
+
+#Endgame tablebases of the computer (Built with tablebase.py)
+TABLEBASE_DIRECTORY = "tablebases"
+
+#Posted by the engine worker thread when valid moves, game status or the computer's move are ready
+ENGINE_EVENT = game.USEREVENT
 IMAGES = {}
 
 def load_images():
 #Load images of pieces
     pieces = np.array(["wR", "wN", "wB", "wQ", "wK", "wp", "bR", "bN", "bB", "bQ", "bK", "bp"])
     for piece in pieces:
-        IMAGES[piece] = game.transform.scale(game.image.load("images\\" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+        IMAGES[piece] = game.transform.scale(game.image.load(os.path.join("images", piece + ".png")), (SQ_SIZE, SQ_SIZE))
         
 def main():
     game.init()
     screen = game.display.set_mode((WIDTH, HEIGHT))
     clock = game.time.Clock()
     screen.fill(game.Color("white"))
-    state = GameState()
+    state = get_backend(BACKEND)()
     load_images()
     running = True
     
@@ -32,17 +57,65 @@ def game_loop(screen, state, clock):
 
     square = ()
     player_clicks = []
+    renderer = BoardRenderer(screen)
+    
+    #Only wake up for events that are handled (Not for every mouse movement)
+    game.event.set_blocked(None)
+    game.event.set_allowed([game.QUIT, game.MOUSEBUTTONDOWN, game.KEYDOWN, game.VIDEOEXPOSE, ENGINE_EVENT])
     
-    #Generate valid moves for White's first turn
-    valid_moves = state.valid_moves()
+    #Valid moves, game status and the computer's moves are computed in a background thread, so the window stays responsive
+    #The results come back as ENGINE_EVENT. Until then there are no valid moves, so clicks can't make a move
+    book = OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+    worker = EngineWorker(COMPUTER_MOVE_TIME, notify=lambda: game.event.post(game.event.Event(ENGINE_EVENT)),
+        searcher=Searcher(book=book, tablebase=Tablebase(TABLEBASE_DIRECTORY)))
+    worker.request(state, search=computer_to_move(state))
+    valid_moves = []
     move_made = False
     notation = ""
     
     while True:
-        for e in game.event.get():
+        #Draw the squares that changed since the last time, then sleep until the next event
+        renderer.draw(state.board)
+        clock.tick(MAX_FPS)
+        human_turn = not computer_to_move(state)
+        events = game.event.get()
+        if not events:
+            events = [game.event.wait()]
+            
+        for e in events:
             if e.type == game.QUIT:
+                worker.stop()
                 return
-            if e.type == game.MOUSEBUTTONDOWN:
+            if e.type == game.VIDEOEXPOSE:
+                renderer.invalidate()
+                
+            #Position analyzed:
+                #Check if game ended (Checkmate / Stalemate / Repetition / Fifty moves). If yes, print result and quit
+                #Computer's turn: Make the move it found within the time limit
+            if e.type == ENGINE_EVENT:
+                for analysis in worker.results():
+                    color = "Black" if state.whiteToMove else "White"
+                    if analysis.result == GameResult.CHECKMATE:
+                        print(color + " won by Checkmate!")
+                        worker.stop()
+                        return
+                    elif analysis.result != GameResult.ONGOING:
+                        print("Draw by " + analysis.result.value)
+                        worker.stop()
+                        return
+                    valid_moves = analysis.valid_moves
+                    if analysis.search is not None:
+                        result = analysis.search
+                        if result.book:
+                            print("Computer played a book move")
+                        elif result.tablebase:
+                            print("Computer played a tablebase move")
+                        else: print("Computer searched depth {}, {} nodes ({} nodes/s, {:.0%} transposition table hits)".format(
+                            result.depth, result.nodes, result.nps, result.tt_hit_rate))
+                        notation = play_move(state, result.move)
+                        move_made = True
+                        
+            if e.type == game.MOUSEBUTTONDOWN and human_turn:
                 location = game.mouse.get_pos()
                 col = location[0]//SQ_SIZE
                 row = location[1]//SQ_SIZE
@@ -62,52 +135,84 @@ def game_loop(screen, state, clock):
                 if len(player_clicks) == 2:
                     move = Move(player_clicks[0], player_clicks[1], state.board)
                     if move in valid_moves:
-                        state.make_move(move)
+                        notation = play_move(state, move)
                         move_made = True
-                        notation = move.get_notation()
-                        if state.inCheck():
-                            notation += '+'
-                        if state.checkMate():
-                            notation += "+"
                         square = ()
                         player_clicks = []
                     else: player_clicks = [square]
                     
             #After [Z] is pressed: undo last move, also reset selection
+            #Against the computer, also undo its reply so it's the player's turn again
+            #A search that is still running is cancelled by the new request
             elif e.type == game.KEYDOWN:
                 if e.key == game.K_z:
                     state.undo_move()
+                    if COMPUTER_PLAYS_WHITE != COMPUTER_PLAYS_BLACK and computer_to_move(state):
+                        state.undo_move()
                     move_made = True
                     square = ()
                     player_clicks = []
                     
         #After move was made or move was undone:
             #If move was made: Print chess notation of move
-            #Check if game ended (Checkmate / Stalemate). If yes, print result and quit
-            #Generate valid moves for next turn
+            #Let the worker analyze the new position (And search the computer's move if it's its turn)
             
         if move_made:
             if notation != "":
                 print(notation)
-            color = "Black" if state.whiteToMove else "White"
-            if state.checkMate():
-                print(color + " won by Checkmate!")
-                return
-            elif state.staleMate():
-                print("Draw by Stalemate")
-                return
+            worker.request(state, search=computer_to_move(state))
+            valid_moves = []
             move_made = False
             notation = ""
-            valid_moves = state.valid_moves()
             
-        #update display of board
-        draw_gamestate(screen, state)
-        clock.tick(MAX_FPS)
-        game.display.flip()
+def computer_to_move(state):
+    return COMPUTER_PLAYS_WHITE if state.whiteToMove else COMPUTER_PLAYS_BLACK
+    
+def play_move(state, move):
+
+    #Make the move and return its notation
+    
+    notation = move_to_san(state, move)
+    state.make_move(move)
+    return notation
+    
+class BoardRenderer():
+
+    #Keeps the window in sync with the board while drawing as little as possible:
+    #The empty board is rendered once, after that only squares whose piece changed (By make_move or undo_move)
+    #are drawn again, and only those are updated on the display
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = game.Surface((WIDTH, HEIGHT))
+        draw_board(self.background)
+        self.invalidate()
+        
+    def invalidate(self):
+    
+        #Draw every square next time, e.g. after the window was covered
+        
+        self.shown = [[None] * DIMENSION for row in range(DIMENSION)]
+        
+    def draw(self, board):
     
-def draw_gamestate(screen, state):
-    draw_board(screen)
-    draw_pieces(screen, state.board)
+        #Compare the board with what is on the screen and redraw the differences. Returns the updated rectangles
+        
+        dirty = []
+        for row in range(DIMENSION):
+            shown_row = self.shown[row]
+            for col in range(DIMENSION):
+                piece = board[row][col]
+                if piece != shown_row[col]:
+                    rect = game.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                    self.screen.blit(self.background, rect, rect)
+                    if piece != "--":
+                        self.screen.blit(IMAGES[piece], rect)
+                    shown_row[col] = piece
+                    dirty.append(rect)
+        if dirty:
+            game.display.update(dirty)
+        return dirty
     
 def draw_board(screen):
     colors = [game.Color("white"), game.Color("grey")]
@@ -117,15 +222,6 @@ def draw_board(screen):
         for col in range(DIMENSION):
             color = colors[((row + col) % 2)]
             game.draw.rect(screen, color, game.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-    
-def draw_pieces(screen, board):
-
-    #for each square of board: if a piece is on it, draw piece on top of square
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != "--":
-                screen.blit(IMAGES[piece], game.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
                 
 if __name__ == "__main__":
     main()
\ No newline at end of file
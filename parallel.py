@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import queue
+import time
+from engine import get_backend
+from search import Searcher
+from tablebase import Tablebase
+from transposition import TranspositionTable
+from transposition import table_bytes
+
+#Lazy SMP: Helper processes search the same position as the main search at the same time, all with one shared
+#transposition table. The helpers fill it with results the main search (and the other helpers) then find there,
+#and whichever process completes the deepest iteration decides the move
+#The position is sent to the helpers as a GameState.snapshot, they start searching their own copy of it
+#
+#   with ParallelSearcher(workers=4) as searcher:
+#       result = searcher.search(state, max_time=1.0)
+
+#Seconds between checks that the helpers are still alive, while the main search waits for their results
+HELPER_CHECK_INTERVAL = 0.1
+
+def helper(index, backend, tt_size_mb, buffer, tablebase_directory, stop_event, requests, results):
+
+    #Runs in a helper process: Searches every position it gets until the main search sets stop_event
+    #Results go back as (index, moveID, score, depth, nodes), moves are looked up again in the main process
+    #A search that fails answers with no move, so the main search doesn't wait for it
+    #Helpers use the same tablebases as the main search, otherwise their scores in the shared table would differ
+
+    searcher = Searcher(tt=TranspositionTable(tt_size_mb, buffer),
+        tablebase=Tablebase(tablebase_directory) if tablebase_directory is not None else None)
+    searcher.stop_event = stop_event
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        snapshot, history, max_depth = request
+        try:
+            state = get_backend(backend).from_snapshot(snapshot, history)
+            result = searcher.search(state, max_depth=max_depth)
+        except Exception:
+            results.put((index, None, 0, 0, 0))
+            continue
+        results.put((index, result.move.moveID if result.move is not None else None, result.score, result.depth,
+            result.nodes))
+
+class ParallelSearcher():
+
+    #Same search API as Searcher, with workers - 1 helper processes
+
+    def __init__(self, workers=None, tt_size_mb=16, book=None, tablebase=None, backend="bitboard"):
+
+        workers = workers if workers is not None else os.cpu_count() or 1
+        self.buffer = multiprocessing.RawArray('b', table_bytes(tt_size_mb))
+        self.searcher = Searcher(tt_size_mb=tt_size_mb, book=book, tablebase=tablebase,
+            tt=TranspositionTable(tt_size_mb, self.buffer))
+        self.tt = self.searcher.tt
+        self.tt.clear()
+        self.stop_event = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        #Request queue and process of every helper, by index
+        self.requests = {}
+        self.helpers = {}
+        for index in range(1, workers):
+            requests = multiprocessing.Queue()
+            process = multiprocessing.Process(target=helper, daemon=True,
+                args=(index, backend, tt_size_mb, self.buffer, tablebase.directory if tablebase is not None else None,
+                self.stop_event, requests, self.results))
+            process.start()
+            self.requests[index] = requests
+            self.helpers[index] = process
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def search(self, state, max_time=None, max_depth=None, info=None):
+
+        #Like Searcher.search. nodes and nps count the helpers too
+
+        start = time.perf_counter()
+        self.stop_event.clear()
+        #Positions since the last capture or Pawn move, the only ones that can be repeated
+        history = state.zobristKeyLog[max(0, len(state.zobristKeyLog) - state.halfmoveClock):]
+        request = (state.snapshot(), history, max_depth)
+        self.tt.next_age()
+        for requests in self.requests.values():
+            requests.put(request)
+        try:
+            result = self.searcher.search(state, max_time=max_time, max_depth=max_depth, info=info)
+        finally:
+            self.stop_event.set()
+
+        best = result
+        nodes = result.nodes
+        waiting = set(self.helpers)
+        while waiting:
+            try:
+                index, moveID, score, depth, helper_nodes = self.results.get(timeout=HELPER_CHECK_INTERVAL)
+            except queue.Empty:
+                #A helper that died won't answer anymore: Search without it from now on
+                for index in [index for index in waiting if not self.helpers[index].is_alive()]:
+                    waiting.discard(index)
+                    del self.helpers[index]
+                    del self.requests[index]
+                continue
+            if index not in waiting:
+                continue
+            waiting.discard(index)
+            nodes += helper_nodes
+            #Book and tablebase moves are always taken, otherwise a helper that got deeper wins
+            if depth > best.depth and moveID is not None and not result.book and not result.tablebase:
+                move = state.get_valid_move(moveID)
+                if move is not None:
+                    best = best._replace(move=move, score=score, depth=depth)
+        elapsed = time.perf_counter() - start
+        return best._replace(nodes=nodes, time=elapsed, nps=int(nodes / elapsed) if elapsed > 0 else 0)
+
+    def stop(self):
+        self.searcher.stop()
+
+    def close(self):
+        self.stop_event.set()
+        for requests in self.requests.values():
+            requests.put(None)
+        for process in self.helpers.values():
+            process.join()
+        self.requests = {}
+        self.helpers = {}
@@ -0,0 +1,123 @@
+import argparse
+import sys
+import time
+from engine import get_backend
+from engine import START_FEN
+
+#Perft: Count all positions that can be reached from a position in exactly N moves
+#Comparing the counts with known results checks that move generation is correct,
+#the time it takes measures how fast it is. Runs headless, without pygame.
+#
+#   python perft.py --depth 4 --divide     Count nodes of the starting position and list them per move
+#   python perft.py --position kiwipete    Count nodes of one of the reference positions
+#   python perft.py --fen "<FEN>"          Count nodes of any position
+#   python perft.py --suite                Check all reference positions against their known counts
+
+#Reference positions: FEN and node counts per depth (1, 2, 3, ...), from https://www.chessprogramming.org/Perft_Results
+REFERENCE_POSITIONS = {
+    "start": (START_FEN,
+        (20, 400, 8902, 197281, 4865609, 119060324)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        (48, 2039, 97862, 4085603, 193690690)),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        (14, 191, 2812, 43238, 674624, 11030083)),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        (6, 264, 9467, 422333, 15833292)),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        (44, 1486, 62379, 2103487, 89941194)),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        (46, 2079, 89890, 3894594, 164075551)),
+}
+
+#Highest depth --suite checks for each position, so the whole suite takes a few minutes at most
+SUITE_DEPTHS = {
+    "start": 4,
+    "kiwipete": 3,
+    "position3": 5,
+    "position4": 3,
+    "position5": 3,
+    "position6": 3,
+}
+
+def perft(state, depth):
+
+    #Number of leaf nodes at the given depth below the current position (Depth 0 is the position itself)
+
+    if depth <= 0:
+        return 1
+    moves = state.valid_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        state.make_move(move)
+        nodes += perft(state, depth - 1)
+        state.undo_move()
+    return nodes
+
+def divide(state, depth):
+
+    #Leaf nodes per move of the current position. Comparing these with another engine shows which move is wrong
+
+    result = []
+    for move in state.valid_moves():
+        state.make_move(move)
+        result.append((move, perft(state, depth - 1) if depth > 1 else 1))
+        state.undo_move()
+    return result
+
+def run(backend, position, depth, show_divide=False, fen=None, out=sys.stdout):
+
+    #Run perft on a reference position (or any FEN) and print the node count, speed and whether it matches the known count
+    #Returns False if the count is wrong
+
+    if fen is None:
+        fen, reference = REFERENCE_POSITIONS[position]
+    else: reference = ()
+    state = get_backend(backend).from_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(state, depth)
+        for move, nodes in counts:
+            out.write("{}: {}\n".format(move.get_uci_notation(), nodes))
+        nodes = sum(n for move, n in counts)
+    else: nodes = perft(state, depth)
+    elapsed = time.perf_counter() - start
+
+    expected = reference[depth - 1] if 1 <= depth <= len(reference) else None
+    if expected is None:
+        status = "(no reference)"
+    else: status = "ok" if nodes == expected else "FAILED, expected {}".format(expected)
+
+    out.write("{} depth {}: {} nodes in {:.2f}s ({:.0f} nodes/s) {}\n".format(
+        position, depth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0, status))
+    return expected is None or nodes == expected
+
+def positive_depth(text):
+    depth = int(text)
+    if depth < 1:
+        raise argparse.ArgumentTypeError("depth must be at least 1")
+    return depth
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generation test")
+    parser.add_argument("--position", default="start", choices=sorted(REFERENCE_POSITIONS))
+    parser.add_argument("--fen", help="position to count instead of a reference position")
+    parser.add_argument("--depth", type=positive_depth, default=3)
+    parser.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    parser.add_argument("--divide", action="store_true", help="print node counts per move")
+    parser.add_argument("--suite", action="store_true", help="check every reference position up to its suite depth")
+    args = parser.parse_args()
+
+    if args.suite:
+        passed = True
+        for position in REFERENCE_POSITIONS:
+            for depth in range(1, SUITE_DEPTHS[position] + 1):
+                passed = run(args.backend, position, depth) and passed
+        sys.exit(0 if passed else 1)
+
+    position = "fen" if args.fen else args.position
+    sys.exit(0 if run(args.backend, position, args.depth, args.divide, args.fen) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import re
+import sys
+import time
+from engine import get_backend
+from engine import Move
+from engine import START_FEN
+from engine import MOVE_CASTLE
+
+#PGN (Portable Game Notation) reading and writing, and SAN (Standard Algebraic Notation) for moves
+#Games are read one at a time from a stream, so files of any size can be processed:
+#
+#   with open("games.pgn") as games:
+#       for game in read_games(games):
+#           for state, move in replay_game(game):
+#               ...
+#
+#   python pgn.py validate games.pgn       Replay every game of a file and report illegal moves
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+SEVEN_TAG_ROSTER = (("Event", "?"), ("Site", "?"), ("Date", "????.??.??"), ("Round", "?"),
+    ("White", "?"), ("Black", "?"), ("Result", "*"))
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_RE = re.compile(r'[{}();]|\$\d+|\d+\.+|[^\s{}();]+')
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+class Game():
+
+    #One game of a PGN file: Tag pairs, moves in SAN and the result
+
+    def __init__(self, headers=None, moves=None, result="*"):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+def move_to_san(state, move):
+
+    #SAN of a valid move in the current position, e.g. "Nbd7", "exd5", "e8=Q+", "O-O" or "Qh7#"
+    #Pieces are only disambiguated (by file, then rank, then both) if another piece of the same type can reach the square
+
+    piece = move.pieceMoved[1]
+    capture = move.pieceCaptured != "--" or (piece == 'p' and move.start[1] != move.end[1])
+
+    if move.moveID & MOVE_CASTLE:
+        san = "O-O" if move.end[1] > move.start[1] else "O-O-O"
+    elif piece == 'p':
+        san = move.get_file(move.start[1]) + 'x' if capture else ""
+        san += move.get_square(move.end[0], move.end[1])
+        if move.promotionPiece:
+            san += "=" + move.promotionPiece
+    else:
+        san = piece
+        others = [other for other in state.valid_moves()
+            if other.pieceMoved == move.pieceMoved and other.end == move.end and other.start != move.start]
+        if others:
+            if all(other.start[1] != move.start[1] for other in others):
+                san += move.get_file(move.start[1])
+            elif all(other.start[0] != move.start[0] for other in others):
+                san += move.get_rank(move.start[0])
+            else: san += move.get_square(move.start[0], move.start[1])
+        if capture:
+            san += 'x'
+        san += move.get_square(move.end[0], move.end[1])
+
+    state.make_move(move)
+    if state.inCheck():
+        san += '#' if len(state.valid_moves()) == 0 else '+'
+    state.undo_move()
+    return san
+
+def parse_san(state, san):
+
+    #Find the valid move of the current position that a SAN string describes
+    #Check marks and annotations ("+", "#", "!", "?") are ignored, castling may be written with zeros,
+    #a promotion without a piece is taken as a Queen. Raises ValueError if no or more than one move matches
+
+    text = san.rstrip("+#!?")
+    moves = state.valid_moves()
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        short = len(text) == 3
+        for move in moves:
+            if move.moveID & MOVE_CASTLE and (move.end[1] > move.start[1]) == short:
+                return move
+        raise ValueError("Illegal move: " + san)
+
+    match = SAN_RE.match(text)
+    if match is None:
+        raise ValueError("Invalid SAN: " + san)
+    piece, file, rank, capture, square, promotion = match.groups()
+    piece = piece or 'p'
+    end = (Move.rankToRow[square[1]], Move.fileToCol[square[0]])
+    if piece == 'p' and (end[0] == 0 or end[0] == 7):
+        promotion = promotion or 'Q'
+    else: promotion = promotion or ""
+
+    candidates = [move for move in moves if move.pieceMoved[1] == piece and move.end == end
+        and move.promotionPiece == promotion
+        and (file is None or move.start[1] == Move.fileToCol[file])
+        and (rank is None or move.start[0] == Move.rankToRow[rank])]
+    if len(candidates) == 0:
+        raise ValueError("Illegal move: " + san)
+    if len(candidates) > 1:
+        raise ValueError("Ambiguous move: " + san)
+    return candidates[0]
+
+def read_games(stream):
+
+    #Generator over the games of a PGN text stream (e.g. an open file), reading it line by line
+    #Comments, variations and NAGs are skipped, only the main line is kept
+
+    game = Game()
+    in_moves = False
+    in_comment = False
+    depth = 0
+
+    for line in stream:
+        if not in_comment and depth == 0 and line.lstrip().startswith('['):
+            header = HEADER_RE.match(line.strip())
+            if header is not None:
+                #Tag pairs after moves start the next game (The previous one had no result)
+                if in_moves:
+                    yield game
+                    game = Game()
+                    in_moves = False
+                game.headers[header.group(1)] = header.group(2).replace('\\"', '"').replace('\\\\', '\\')
+                continue
+
+        for token in TOKEN_RE.findall(line):
+            if in_comment:
+                if token == '}':
+                    in_comment = False
+                continue
+            if token == '{':
+                in_comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth > 0 or token[0] == '$' or token[0].isdigit() and token.rstrip('.').isdigit():
+                continue
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game = Game()
+                in_moves = False
+            else:
+                game.moves.append(token)
+                in_moves = True
+
+    if in_moves or game.headers:
+        yield game
+
+def replay_game(game, backend="bitboard"):
+
+    #Replay a game: Yields the position before every move and the move itself
+    #The position belongs to the generator and changes when the next move is requested
+    #Raises ValueError at the first illegal move
+
+    state = get_backend(backend).from_fen(game.headers.get("FEN", START_FEN))
+    for san in game.moves:
+        move = parse_san(state, san)
+        yield state, move
+        state.make_move(move)
+
+def write_game(out, moves, headers=None, result="*", fen=START_FEN, backend="bitboard"):
+
+    #Write a game as PGN: Tag pairs (At least the Seven Tag Roster) and the moves in SAN, wrapped at 80 characters
+    #moves are Move objects, played from the position fen
+
+    headers = dict(headers or {})
+    headers["Result"] = result
+    if fen != START_FEN:
+        headers["SetUp"] = "1"
+        headers["FEN"] = fen
+    for tag, default in SEVEN_TAG_ROSTER:
+        out.write('[{} "{}"]\n'.format(tag, escape(headers.pop(tag, default))))
+    for tag, value in headers.items():
+        out.write('[{} "{}"]\n'.format(tag, escape(value)))
+    out.write("\n")
+
+    state = get_backend(backend).from_fen(fen)
+    tokens = []
+    for move in moves:
+        if state.whiteToMove:
+            tokens.append("{}.".format(state.fullmoveNumber))
+        elif not tokens:
+            tokens.append("{}...".format(state.fullmoveNumber))
+        tokens.append(move_to_san(state, move))
+        state.make_move(move)
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            out.write(line + "\n")
+            line = token
+        else: line = line + " " + token if line else token
+    out.write(line + "\n\n")
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def validate(path, backend):
+
+    #Replay every game of a PGN file, print every game with an illegal move and a summary
+
+    games = 0
+    invalid = 0
+    moves = 0
+    start = time.perf_counter()
+    with open(path) as stream:
+        for game in read_games(stream):
+            games += 1
+            try:
+                for state, move in replay_game(game, backend):
+                    moves += 1
+            except ValueError as error:
+                invalid += 1
+                print("Game {} ({} - {}): {}".format(games, game.headers.get("White", "?"),
+                    game.headers.get("Black", "?"), error))
+    elapsed = time.perf_counter() - start
+    print("{} games, {} invalid, {} moves in {:.1f}s ({:.0f} moves/s)".format(
+        games, invalid, moves, elapsed, moves / elapsed if elapsed > 0 else 0))
+    return invalid == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="PGN tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_validate = subparsers.add_parser("validate", help="replay every game of a PGN file")
+    parser_validate.add_argument("path")
+    parser_validate.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        sys.exit(0 if validate(args.path, args.backend) else 1)
+
+if __name__ == "__main__":
+    main()
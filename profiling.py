@@ -0,0 +1,191 @@
+import argparse
+import cProfile
+import pstats
+import sys
+import time
+from engine import get_backend
+from engine import START_FEN
+from perft import perft
+from perft import REFERENCE_POSITIONS
+from search import Searcher
+
+#Instrumentation of the GameState hot paths: Calls and time of every method in PROFILED_METHODS
+#The methods are only wrapped while a Profiler is running, so there is no cost at all when it's off
+#
+#   with Profiler(get_backend("bitboard")) as profiler:
+#       perft(state, 4)
+#   profiler.report()
+#
+#   python profiling.py perft --depth 4                           Counters and timers of a perft run
+#   python profiling.py game --plies 40 --depth 2 --cprofile game.prof   Engine game, also saved for pstats/snakeviz
+#
+#(updatePiecesMoved of older versions is now updateCastlingRights)
+
+PROFILED_METHODS = ("make_move", "undo_move", "valid_moves", "generateValidMoves", "generateValidMovesOfKind",
+    "generateValidMovesFrom", "possible_moves", "inCheck", "kingInCheck", "updateCastlingRights")
+
+#Methods that generate moves: Their results are counted for the moves per second
+GENERATING_METHODS = ("generateValidMoves", "generateValidMovesOfKind", "generateValidMovesFrom")
+
+class MethodStats():
+
+    __slots__ = ("calls", "time", "moves", "generation_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        #Only for generating methods: Moves returned and time, from the calls that didn't use another generating method
+        self.moves = 0
+        self.generation_time = 0.0
+
+class Profiler():
+
+    def __init__(self, backend, methods=PROFILED_METHODS):
+        self.backend = backend
+        self.methods = methods
+        self.stats = {}
+        self.originals = {}
+        self.elapsed = 0.0
+        self.started = None
+        #Calls of generating methods so far: Moves are only counted by the innermost one, which did the work
+        self.generating = [0]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exception):
+        self.stop()
+
+    def start(self):
+
+        #Replace the methods of the backend class with counting and timing wrappers
+
+        for name in self.methods:
+            if not hasattr(self.backend, name):
+                continue
+            #Remember if the class defines the method itself or inherits it, so stop can restore exactly that
+            self.originals[name] = self.backend.__dict__.get(name)
+            stats = self.stats.setdefault(name, MethodStats())
+            generating = self.generating if name in GENERATING_METHODS else None
+            setattr(self.backend, name, timed(getattr(self.backend, name), stats, generating))
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.elapsed += time.perf_counter() - self.started
+        for name, original in self.originals.items():
+            if original is None:
+                delattr(self.backend, name)
+            else: setattr(self.backend, name, original)
+        self.originals = {}
+
+    def positions(self):
+
+        #Positions visited: Every make_move reaches a new one
+
+        stats = self.stats.get("make_move")
+        return stats.calls if stats is not None else 0
+
+    def generated(self):
+
+        #Moves generated (Not taken from the cache) and the time it took
+
+        moves = sum(self.stats[name].moves for name in GENERATING_METHODS if name in self.stats)
+        seconds = sum(self.stats[name].generation_time for name in GENERATING_METHODS if name in self.stats)
+        return moves, seconds
+
+    def report(self, out=sys.stdout):
+
+        #Times include the methods called from a method, e.g. valid_moves includes generateValidMoves
+
+        positions = self.positions()
+        out.write("{:<26}{:>10}{:>14}{:>12}{:>10}{:>8}\n".format("Method", "Calls", "Per position", "Total ms", "us/call", "% run"))
+        for name in self.methods:
+            stats = self.stats.get(name)
+            if stats is None or stats.calls == 0:
+                continue
+            out.write("{:<26}{:>10}{:>14.2f}{:>12.1f}{:>10.2f}{:>7.1f}%\n".format(name, stats.calls,
+                stats.calls / positions if positions else 0, stats.time * 1e3, stats.time / stats.calls * 1e6,
+                stats.time / self.elapsed * 100 if self.elapsed > 0 else 0))
+        moves, seconds = self.generated()
+        out.write("\n{} positions in {:.2f}s ({:.0f} positions/s)\n".format(positions, self.elapsed,
+            positions / self.elapsed if self.elapsed > 0 else 0))
+        out.write("{} moves generated in {:.2f}s ({:.0f} moves/s)\n".format(moves, seconds, moves / seconds if seconds > 0 else 0))
+
+def timed(function, stats, generating=None):
+
+    #Wrapper that adds the calls and time of function to stats
+    #For generating methods also the moves returned, unless it called another generating method (Which counts them)
+
+    perf_counter = time.perf_counter
+    if generating is not None:
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            generating[0] += 1
+            calls = generating[0]
+            result = function(*args, **kwargs)
+            elapsed = perf_counter() - start
+            stats.time += elapsed
+            stats.calls += 1
+            if generating[0] == calls:
+                stats.moves += len(result)
+                stats.generation_time += elapsed
+            return result
+    else:
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            stats.time += perf_counter() - start
+            stats.calls += 1
+            return result
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+def play_game(state, plies, depth):
+
+    #Scripted game: The engine plays both sides at a fixed depth, so every run does the same work
+
+    searcher = Searcher()
+    for ply in range(plies):
+        if not state.valid_moves():
+            break
+        state.make_move(searcher.search(state, max_depth=depth).move)
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the engine")
+    parser.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    parser.add_argument("--cprofile", default=None, help="run under cProfile instead and save the stats to this file")
+    subparsers = parser.add_subparsers(dest="workload", required=True)
+
+    parser_perft = subparsers.add_parser("perft", help="profile a perft run")
+    parser_perft.add_argument("--position", default="start", choices=sorted(REFERENCE_POSITIONS))
+    parser_perft.add_argument("--fen", default=None)
+    parser_perft.add_argument("--depth", type=int, default=3)
+
+    parser_game = subparsers.add_parser("game", help="profile an engine vs engine game")
+    parser_game.add_argument("--fen", default=START_FEN)
+    parser_game.add_argument("--plies", type=int, default=20)
+    parser_game.add_argument("--depth", type=int, default=2)
+
+    args = parser.parse_args()
+    backend = get_backend(args.backend)
+    if args.workload == "perft":
+        state = backend.from_fen(args.fen or REFERENCE_POSITIONS[args.position][0])
+        workload = lambda: perft(state, args.depth)
+    else:
+        state = backend.from_fen(args.fen)
+        workload = lambda: play_game(state, args.plies, args.depth)
+
+    if args.cprofile:
+        profile = cProfile.Profile()
+        profile.runcall(workload)
+        profile.dump_stats(args.cprofile)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(20)
+        print("Saved to " + args.cprofile)
+    else:
+        with Profiler(backend) as profiler:
+            workload()
+        profiler.report()
+
+if __name__ == "__main__":
+    main()
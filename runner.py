@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from engine import get_backend
+from engine import GameResult
+from engine import START_FEN
+from book import OpeningBook
+from search import Searcher
+from tablebase import Tablebase
+
+#Headless batch runner: Plays engine vs engine games or analyzes positions on all cores
+#Positions are sent to the worker processes as FEN strings, results come back as JSON lines
+#
+#   python runner.py selfplay --games 1000 --depth 2 --output games.jsonl
+#   python runner.py analyze positions.fen --movetime 0.5 --output analysis.jsonl
+
+#Every worker process keeps one Searcher (And its transposition table and opening book) for all of its tasks
+#The book file is memory-mapped, so all processes share the same pages of it
+_searcher = None
+
+def get_searcher(hash_mb, book_path=None, tablebase_directory=None):
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher(tt_size_mb=hash_mb, book=OpeningBook(book_path) if book_path else None,
+            tablebase=Tablebase(tablebase_directory) if tablebase_directory else None)
+    return _searcher
+
+def play_game(task):
+
+    #Play one game from the task's FEN. The first random_plies moves are random, so games differ from each other
+    #Runs in a worker process, returns a result dict
+
+    state = get_backend(task["backend"]).from_fen(task["fen"])
+    searcher = get_searcher(task["hash_mb"], task["book"], task["tablebases"])
+    searcher.rng.seed(task["seed"])
+    rng = random.Random(task["seed"])
+    moves = []
+    nodes = 0
+    start = time.perf_counter()
+
+    result = state.gameResult()
+    while result == GameResult.ONGOING and len(moves) < task["max_plies"]:
+        if len(moves) < task["random_plies"]:
+            move = rng.choice(state.valid_moves())
+        else:
+            search = searcher.search(state, max_time=task["movetime"], max_depth=task["depth"])
+            move = search.move
+            nodes += search.nodes
+        moves.append(move.get_uci_notation())
+        state.make_move(move)
+        result = state.gameResult()
+
+    if result == GameResult.CHECKMATE:
+        score = "0-1" if state.whiteToMove else "1-0"
+    elif result == GameResult.ONGOING:
+        score = "*"
+    else: score = "1/2-1/2"
+    elapsed = time.perf_counter() - start
+    return {"id": task["id"], "fen": task["fen"], "result": score, "termination": result.value,
+        "plies": len(moves), "moves": moves, "nodes": nodes, "time": round(elapsed, 3)}
+
+def analyze_position(task):
+
+    #Search one position. Runs in a worker process, returns a result dict
+
+    state = get_backend(task["backend"]).from_fen(task["fen"])
+    search = get_searcher(task["hash_mb"], None, task["tablebases"]).search(state, max_time=task["movetime"], max_depth=task["depth"])
+    return {"id": task["id"], "fen": task["fen"],
+        "bestmove": search.move.get_uci_notation() if search.move is not None else None,
+        "score": search.score, "depth": search.depth, "nodes": search.nodes, "time": round(search.time, 3)}
+
+def run_tasks(function, tasks, workers, out):
+
+    #Run function on all tasks in a process pool and write every result as one JSON line as soon as it's done
+    #Only a few tasks per worker are queued at a time, so tasks can come from a file of any size
+    #A task that fails (e.g. an invalid FEN) gets an {"id", "fen", "error"} line instead, the others go on
+    #Returns the number of tasks and the summed up nodes of all results
+
+    count = 0
+    nodes = 0
+    max_pending = workers * 4
+    #Task of every running future, for the error line
+    pending = {}
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for task in tasks:
+                pending[executor.submit(function, task)] = task
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    result = {"id": task["id"], "fen": task["fen"], "error": "{}: {}".format(type(error).__name__, error),
+                        "nodes": 0}
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                count += 1
+                nodes += result["nodes"]
+    return count, nodes
+
+def read_positions(path):
+
+    #One FEN per line, empty lines and lines starting with # are skipped
+
+    with open(path) as positions:
+        for line in positions:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch self-play and position analysis")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    parser.add_argument("--depth", type=int, default=None, help="search depth per move")
+    parser.add_argument("--movetime", type=float, default=None, help="seconds per move")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size per worker in MB")
+    parser.add_argument("--tablebases", default=None, help="directory of endgame tablebases (Built with tablebase.py)")
+    parser.add_argument("--output", default=None, help="JSONL file for the results (default: stdout)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_selfplay = subparsers.add_parser("selfplay", help="play engine vs engine games")
+    parser_selfplay.add_argument("--games", type=int, default=100)
+    parser_selfplay.add_argument("--fen", default=START_FEN, help="starting position of every game")
+    parser_selfplay.add_argument("--random-plies", type=int, default=4, help="random moves at the start of each game")
+    parser_selfplay.add_argument("--max-plies", type=int, default=300, help="stop unfinished games after this many moves")
+    parser_selfplay.add_argument("--seed", type=int, default=0)
+    parser_selfplay.add_argument("--book", default=None, help="opening book for the engine moves (Built with book.py)")
+
+    parser_analyze = subparsers.add_parser("analyze", help="search every position of a FEN file")
+    parser_analyze.add_argument("positions", help="file with one FEN per line")
+
+    args = parser.parse_args()
+    if args.depth is None and args.movetime is None:
+        args.depth = 2
+
+    common = {"backend": args.backend, "depth": args.depth, "movetime": args.movetime, "hash_mb": args.hash,
+        "tablebases": args.tablebases}
+    if args.command == "selfplay":
+        function = play_game
+        tasks = (dict(common, id=i, fen=args.fen, seed=args.seed * 1000003 + i, random_plies=args.random_plies,
+            max_plies=args.max_plies, book=args.book) for i in range(args.games))
+    else:
+        function = analyze_position
+        tasks = (dict(common, id=i, fen=fen) for i, fen in enumerate(read_positions(args.positions)))
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        count, nodes = run_tasks(function, tasks, args.workers or os.cpu_count() or 1, out)
+    finally:
+        if args.output:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    unit = "games" if args.command == "selfplay" else "positions"
+    sys.stderr.write("{} {} in {:.1f}s ({:.2f} {}/s), {} nodes ({:.0f} nodes/s)\n".format(
+        count, unit, elapsed, count / elapsed if elapsed > 0 else 0, unit, nodes, nodes / elapsed if elapsed > 0 else 0))
+
+if __name__ == "__main__":
+    main()
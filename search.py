@@ -0,0 +1,358 @@
+import random
+import time
+from collections import namedtuple
+from engine import MOVE_CAPTURE
+from evaluation import evaluate
+from evaluation import PIECE_VALUES
+from transposition import TranspositionTable
+from transposition import EXACT, LOWER_BOUND, UPPER_BOUND, NO_MOVE
+from tablebase import WIN, LOSS
+
+#Alpha-beta search on top of GameState.valid_moves/make_move/undo_move
+#
+#   searcher = Searcher()
+#   result = searcher.search(state, max_time=1.0)
+#   state.make_move(result.move)
+
+INFINITY = 1000000
+CHECKMATE = 100000
+#Scores closer to CHECKMATE than this are mate scores
+MATE_SCORE_LIMIT = CHECKMATE - 1000
+
+#Scores used to sort moves before searching them: Best move of the previous iteration or transposition table, then captures
+#(most valuable victim first, least valuable attacker first), then killer moves, then quiet moves by history
+ORDER_PREVIOUS_BEST = 30000000
+ORDER_CAPTURE = 20000000
+ORDER_KILLER = 10000000
+
+#Move.moveID bits of captures and promotions: Only these moves can lead into a tablebase
+MATERIAL_CHANGE = MOVE_CAPTURE | 7 << 12
+
+#How often (in nodes) the search looks at the clock: Often enough to stop within a few ms even on the mailbox backend
+TIME_CHECK_INTERVAL = 64
+
+#book/tablebase: The move was taken from the opening book or the endgame tablebases without searching
+SearchResult = namedtuple("SearchResult", "move score depth nodes time nps tt_hit_rate book tablebase", defaults=(False, False))
+
+class SearchTimeout(Exception):
+    pass
+
+class Searcher():
+
+    def __init__(self, max_ply=128, tt_size_mb=16, book=None, tablebase=None, tt=None):
+
+        self.max_ply = max_ply
+        #Optional OpeningBook: Its moves are played without searching as long as the position is in it
+        self.book = book
+        self.rng = random.Random()
+        #Optional Tablebase: Positions with few pieces are looked up instead of searched
+        self.tablebase = tablebase
+        #Kept between searches, positions from the previous move are often reached again
+        #(tt: A table to use instead, e.g. one shared with the other processes of a parallel search)
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        #Killer moves: Two quiet moves per ply that caused a beta cutoff
+        self.killers = [[None, None] for ply in range(max_ply)]
+        #History heuristic: How often (weighted by depth) a quiet move caused a beta cutoff
+        self.history = {}
+        self.nodes = 0
+        self.deadline = None
+        self.stop_requested = False
+        #Optional multiprocessing.Event: Another process can set it to stop the search, like stop()
+        self.stop_event = None
+        self.root_moves = 0
+        self.root_best = None
+
+    def search(self, state, max_time=None, max_depth=None, info=None):
+
+        #Iterative deepening: Search depth 1, 2, 3, ... until max_depth is reached or the time is up
+        #The result of the deepest completed iteration is returned
+        #info(depth, score, nodes, seconds, move) is called after every completed iteration
+
+        start = time.perf_counter()
+        self.deadline = start + max_time if max_time is not None else None
+        self.stop_requested = False
+        self.nodes = 0
+        self.killers = [[None, None] for ply in range(self.max_ply)]
+        self.history = {}
+        self.tt.new_search()
+        probes, hits = self.tt.probes, self.tt.hits
+
+        moves = state.valid_moves()
+        if not moves:
+            return SearchResult(None, -CHECKMATE if state.inCheck() else 0, 0, 0, 0.0, 0, 0.0)
+
+        if self.book is not None:
+            move = self.book.choose(state, self.rng)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, time.perf_counter() - start, 0, 0.0, True)
+
+        if self.tablebase is not None:
+            entry = self.tablebase_move(state, moves)
+            if entry is not None:
+                return SearchResult(entry[1], entry[0], 0, 0, time.perf_counter() - start, 0, 0.0, False, True)
+
+        best_move = None
+        best_score = 0
+        depth_reached = 0
+        max_depth = max_depth if max_depth is not None else self.max_ply - 1
+
+        #Saved, so a search that is stopped in the middle of an iteration can go back to the root at once
+        state.push_snapshot()
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self.search_root(state, moves, depth, best_move)
+            except SearchTimeout:
+                #Stopped before the first iteration completed: Take the best move searched so far, otherwise the
+                #first one by move order (A capture or a move with a good history), never an unsorted move
+                if best_move is None:
+                    best_move, best_score = self.root_best if self.root_best is not None else (self.order_moves(moves, 0)[0], 0)
+                break
+            best_move, best_score, depth_reached = move, score, depth
+            if info is not None:
+                info(depth, score, self.nodes, time.perf_counter() - start, move)
+            #No need to search deeper once a forced mate was found
+            if abs(score) >= CHECKMATE - self.max_ply:
+                break
+        state.pop_snapshot()
+
+        elapsed = time.perf_counter() - start
+        probes = self.tt.probes - probes
+        return SearchResult(best_move, best_score, depth_reached, self.nodes, elapsed,
+            int(self.nodes / elapsed) if elapsed > 0 else 0, (self.tt.hits - hits) / probes if probes > 0 else 0.0)
+
+    def tablebase_move(self, state, moves):
+
+        #(score, move) of the best move by the tablebases: Fastest win, otherwise a draw, otherwise the longest loss
+        #None if the position or one of its moves is not in the tablebases
+
+        if self.tablebase.probe(state) is None:
+            return None
+        best = None
+        for move in moves:
+            state.make_move(move)
+            entry = self.tablebase.probe(state)
+            state.undo_move()
+            if entry is None:
+                return None
+            score = -tablebase_score(entry, 1)
+            if best is None or score > best[0]:
+                best = (score, move)
+        return best
+
+    def search_root(self, state, moves, depth, previous_best):
+
+        alpha = -INFINITY
+        best_move = None
+        #(move, score) of the best move of this iteration so far, in case it is stopped before it ends
+        self.root_best = None
+        for move in self.order_moves(moves, 0, previous_best):
+            state.make_move(move)
+            score = -self.negamax(state, depth - 1, -INFINITY, -alpha, 1)
+            state.undo_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self.root_best = (move, score)
+        self.tt.store(state.zobristKey, depth, score_to_tt(alpha, 0), EXACT, best_move.moveID if best_move is not None else NO_MOVE)
+        return alpha, best_move
+
+    def negamax(self, state, depth, alpha, beta, ply):
+
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self.check_time()
+
+        #A position that occurred before is scored as a draw: If repeating it was best, it can be repeated again
+        if state.repetitions() > 1 or state.fiftyMoveRule():
+            return 0
+
+        #After a capture or promotion there may be few enough pieces left for the tablebases
+        if self.tablebase is not None and state.moveLog[-1].moveID & MATERIAL_CHANGE:
+            entry = self.tablebase.probe(state)
+            if entry is not None:
+                return tablebase_score(entry, ply)
+
+        if depth <= 0 or ply >= self.max_ply - 1:
+            return self.quiescence(state, alpha, beta, ply)
+
+        #Use the stored result if it was searched at least as deep and its bound decides this node
+        key = state.zobristKey
+        entry = self.tt.probe(key)
+        hash_move = NO_MOVE
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if entry_depth >= depth:
+                entry_score = score_from_tt(entry_score, ply)
+                if (bound == EXACT or (bound == LOWER_BOUND and entry_score >= beta)
+                    or (bound == UPPER_BOUND and entry_score <= alpha)):
+                    return entry_score
+
+        alpha_start = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in self.pick_moves(state, ply, hash_move):
+            state.make_move(move)
+            score = -self.negamax(state, depth - 1, -beta, -alpha, ply + 1)
+            state.undo_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not self.is_capture(move):
+                            self.store_killer(move, ply)
+                            history_key = (move.pieceMoved, move.end)
+                            self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+                        break
+
+        if best_move is None:
+            #No valid moves: Checkmate (Sooner is better) or Stalemate
+            return -CHECKMATE + ply if state.inCheck() else 0
+
+        if best_score >= beta:
+            bound = LOWER_BOUND
+        elif best_score > alpha_start:
+            bound = EXACT
+        else: bound = UPPER_BOUND
+        self.tt.store(key, depth, score_to_tt(best_score, ply), bound, best_move.moveID)
+        return best_score
+
+    def quiescence(self, state, alpha, beta, ply):
+
+        #Only search captures until the position is quiet, so the evaluation doesn't stop in the middle of an exchange
+        #The player to move can also stop capturing ("Stand pat"), so the static evaluation is a lower bound
+
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self.check_time()
+
+        stand_pat = evaluate(state)
+        if stand_pat >= beta or ply >= self.max_ply - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = state.valid_captures()
+        captures.sort(key=self.capture_order, reverse=True)
+        for move in captures:
+            state.make_move(move)
+            score = -self.quiescence(state, -beta, -alpha, ply + 1)
+            state.undo_move()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def pick_moves(self, state, ply, hash_move=NO_MOVE):
+
+        #Yields the moves of a position in stages: Hash move, captures (MVV-LVA), killer moves, quiet moves (by history)
+        #A stage is only generated once the moves before it are used up, so a beta cutoff by an early move
+        #saves generating (and allocating) the rest
+
+        tried = []
+        if hash_move != NO_MOVE:
+            move = state.get_valid_move(hash_move)
+            if move is not None:
+                tried.append(hash_move)
+                yield move
+
+        captures = state.valid_captures()
+        captures.sort(key=self.capture_order, reverse=True)
+        for move in captures:
+            if move.moveID != hash_move:
+                yield move
+
+        #Killers are quiet moves from other positions, so they are only played if they are valid here
+        for killer in self.killers[ply]:
+            if killer is not None and killer.moveID not in tried:
+                move = state.get_valid_move(killer.moveID)
+                if move is not None:
+                    tried.append(killer.moveID)
+                    yield move
+
+        history = self.history
+        quiets = state.valid_quiet_moves()
+        quiets.sort(key=lambda move: history.get((move.pieceMoved, move.end), 0), reverse=True)
+        for move in quiets:
+            if move.moveID not in tried:
+                yield move
+
+    def order_moves(self, moves, ply, previous_best=None, hash_move=NO_MOVE):
+
+        #All moves sorted at once, used at the root where every move is searched anyway
+
+        killers = self.killers[ply]
+        history = self.history
+
+        def order(move):
+            if previous_best is not None and move == previous_best:
+                return ORDER_PREVIOUS_BEST
+            if move.moveID == hash_move:
+                return ORDER_PREVIOUS_BEST
+            if self.is_capture(move):
+                return ORDER_CAPTURE + self.capture_order(move)
+            if move == killers[0]:
+                return ORDER_KILLER + 1
+            if move == killers[1]:
+                return ORDER_KILLER
+            return history.get((move.pieceMoved, move.end), 0)
+
+        return sorted(moves, key=order, reverse=True)
+
+    def capture_order(self, move):
+
+        #MVV-LVA: Most valuable victim first, then least valuable attacker (En passant captures a Pawn)
+
+        victim = move.pieceCaptured[1] if move.pieceCaptured != "--" else 'p'
+        return PIECE_VALUES[victim] * 10 - PIECE_VALUES[move.pieceMoved[1]] // 10
+
+    def is_capture(self, move):
+        return move.moveID & MOVE_CAPTURE != 0
+
+    def store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def stop(self):
+
+        #Can be called from another thread: The search ends at its next time check like after a timeout
+
+        self.stop_requested = True
+
+    def check_time(self):
+        if (self.stop_requested or (self.deadline is not None and time.perf_counter() >= self.deadline)
+            or (self.stop_event is not None and self.stop_event.is_set())):
+            raise SearchTimeout()
+
+def score_to_tt(score, ply):
+
+    #Mate scores count the moves from the root. In the table they are stored as moves from the position itself,
+    #because the same position can be reached at a different ply
+
+    if score >= MATE_SCORE_LIMIT:
+        return score + ply
+    if score <= -MATE_SCORE_LIMIT:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE_LIMIT:
+        return score - ply
+    if score <= -MATE_SCORE_LIMIT:
+        return score + ply
+    return score
+
+def tablebase_score(entry, ply):
+
+    #Tablebase result as a search score: Won and lost positions get the mate score of the Checkmate they end in
+
+    value, plies = entry
+    if value == WIN:
+        return CHECKMATE - ply - plies
+    if value == LOSS:
+        return -CHECKMATE + ply + plies
+    return 0
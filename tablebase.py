@@ -0,0 +1,399 @@
+import argparse
+import os
+import time
+import numpy as np
+from bitboard import BITS, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, ROOK_RAYS, BISHOP_RAYS
+from bitboard import sliding_attacks
+from engine import get_backend
+from zobrist import en_passant_key
+
+#Endgame tablebases: For every position of a material set (e.g. King and Queen vs King) whether the side to move
+#wins, draws or loses, and in how many plies the game ends in Checkmate with best play
+#
+#   python tablebase.py generate KQvK KRvK KPvK     Build the tables (And every smaller one they lead to)
+#   python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+#
+#Tables are built by retrograde analysis: Starting from the Checkmates, the results are passed back move by move
+#to the positions that lead to them, until nothing changes anymore. Everything that is left is a draw
+#
+#A table is a NumPy file of shape (2, 2 * 64^pieces), int16: Row 0 is WIN/DRAW/LOSS for the side to move, row 1 the plies
+#until Checkmate. The index of a position is the side to move (0 = White) followed by the squares (row * 8 + col) of the
+#pieces, 6 bits each, in the order of the table's name. The files are memory-mapped, so a probe is one array lookup
+#Tables know nothing about castling, En passant or the fifty-move rule
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+TABLEBASE_DIRECTORY = "tablebases"
+
+#Tables for more pieces can be generated, but take a lot longer (Every extra piece makes a table 64 times bigger)
+MAX_PIECES = 4
+
+#Order of the pieces within one side of a table name, and what decides which side is listed first (The stronger one)
+PIECE_ORDER = "KQRBNp"
+MATERIAL_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
+
+def side_name(pieces):
+    return "".join(pieces).replace('p', 'P')
+
+def table_pieces(name):
+
+    #"KRvKN" -> ["wK", "wR", "bK", "bN"]
+
+    white, black = name.replace('P', 'p').split('v')
+    return ['w' + piece for piece in white] + ['b' + piece for piece in black]
+
+def strength(pieces):
+    return (sum(MATERIAL_VALUES[piece] for piece in pieces), len(pieces), [-PIECE_ORDER.index(piece) for piece in pieces])
+
+def insufficient_material(name):
+
+    #Only a lone Bishop or Knight (Or nothing) besides the Kings: Checkmate is impossible, no table needed
+
+    rest = name.replace('K', '').replace('v', '')
+    return rest in ("", "B", "N")
+
+def canonical(pieces, white_to_move):
+
+    #Table name, squares in the order of the table and side to move of a position given as [(piece, square), ...]
+    #If Black has the stronger pieces, the board is mirrored and the colors swapped, so it fits the table with White stronger
+
+    order = PIECE_ORDER.index
+    white = sorted((item for item in pieces if item[0][0] == 'w'), key=lambda item: order(item[0][1]))
+    black = sorted((item for item in pieces if item[0][0] == 'b'), key=lambda item: order(item[0][1]))
+    white_pieces = [piece[1] for piece, sq in white]
+    black_pieces = [piece[1] for piece, sq in black]
+    if strength(black_pieces) > strength(white_pieces):
+        white, black = [(piece, sq ^ 56) for piece, sq in black], [(piece, sq ^ 56) for piece, sq in white]
+        white_pieces, black_pieces = black_pieces, white_pieces
+        white_to_move = not white_to_move
+    name = side_name(white_pieces) + 'v' + side_name(black_pieces)
+    return name, [sq for piece, sq in white + black], white_to_move
+
+def table_index(squares, white_to_move):
+    index = 0 if white_to_move else 1
+    for sq in squares:
+        index = index * 64 + sq
+    return index
+
+def attacks(piece, sq, occupied):
+
+    #Squares a piece attacks (For Pawns: Captures only)
+
+    kind = piece[1]
+    if kind == 'K':
+        return KING_ATTACKS[sq]
+    if kind == 'N':
+        return KNIGHT_ATTACKS[sq]
+    if kind == 'p':
+        return PAWN_ATTACKS[piece[0]][sq]
+    if kind == 'R':
+        return sliding_attacks(sq, occupied, ROOK_RAYS)
+    if kind == 'B':
+        return sliding_attacks(sq, occupied, BISHOP_RAYS)
+    return sliding_attacks(sq, occupied, ROOK_RAYS) | sliding_attacks(sq, occupied, BISHOP_RAYS)
+
+def attacked(sq, color, pieces, squares, occupied, captured=-1):
+
+    #Is sq attacked by a piece of color? The piece with index captured was just taken and doesn't count
+
+    target = BITS[sq]
+    for i, piece in enumerate(pieces):
+        if i != captured and piece[0] == color and attacks(piece, squares[i], occupied) & target:
+            return True
+    return False
+
+class Tablebase():
+
+    #Probes all tables in a directory. Tables are opened (memory-mapped) the first time a position needs them
+
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name):
+
+        #Array of a material set, None if there is no file for it
+
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + ".npy")
+            self.tables[name] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        return self.tables[name]
+
+    def lookup(self, pieces, white_to_move):
+
+        #(WIN/DRAW/LOSS, plies until Checkmate) for the side to move of a position given as [(piece, square), ...]
+        #None if there is no table for its material
+
+        name, squares, white_to_move = canonical(pieces, white_to_move)
+        if insufficient_material(name):
+            return DRAW, 0
+        table = self.table(name)
+        if table is None:
+            return None
+        index = table_index(squares, white_to_move)
+        return int(table[0, index]), int(table[1, index])
+
+    def probe(self, state):
+
+        #Result of a GameState for the side to move, None if it has too many pieces, castling rights,
+        #an En passant capture or no table
+
+        if state.castlingRights or en_passant_key(state):
+            return None
+        if hasattr(state, "pieces"):
+            #Bitboard backend: Count the pieces before collecting them
+            if sum(bin(mask).count('1') for mask in state.pieces.values()) > MAX_PIECES:
+                return None
+            pieces = []
+            for piece, mask in state.pieces.items():
+                while mask:
+                    sq = (mask & -mask).bit_length() - 1
+                    mask &= mask - 1
+                    pieces.append((piece, sq))
+        else:
+            pieces = []
+            for row in range(8):
+                for col in range(8):
+                    if state.board[row][col] != "--":
+                        pieces.append((str(state.board[row][col]), row * 8 + col))
+                        if len(pieces) > MAX_PIECES:
+                            return None
+        return self.lookup(pieces, state.whiteToMove)
+
+def dependencies(name):
+
+    #Material sets a position can turn into by a capture or a promotion
+
+    pieces = table_pieces(name)
+    names = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] != 'K':
+            names.add(canonical([(other, 0) for j, other in enumerate(pieces) if j != i], True)[0])
+        if piece[1] == 'p':
+            for promotion in "QRBN":
+                names.add(canonical([(other if j != i else piece[0] + promotion, 0) for j, other in enumerate(pieces)], True)[0])
+    return names
+
+def generate(name, tablebase, log=print):
+
+    #Build the table of a material set and save it in the tablebase's directory
+    #Tables of the material sets it leads to are generated first, if they are missing
+
+    for dependency in sorted(dependencies(name)):
+        if not insufficient_material(dependency) and tablebase.table(dependency) is None:
+            generate(dependency, tablebase, log)
+
+    start = time.perf_counter()
+    pieces = table_pieces(name)
+    count = len(pieces)
+    size = 2 * 64 ** count
+    colors = [piece[0] for piece in pieces]
+    kings = {'w': pieces.index("wK"), 'b': pieces.index("bK")}
+
+    #One byte or two per position, so tables with MAX_PIECES pieces (2 * 64^4 positions) still fit in memory
+    #status: 0 = Illegal position, 1 = Not decided yet, 2 = Decided
+    status = bytearray(size)
+    result = np.full(size, DRAW, dtype=np.int8)
+    plies = np.zeros(size, dtype=np.int16)
+    #Moves inside the table whose result isn't known yet. A position is lost once all of its moves turned out to lose
+    moves_left = np.zeros(size, dtype=np.uint8)
+    #Longest loss by a move that leaves the table (Capture or promotion): A lost position can't end sooner than that
+    exit_loss = {}
+    #Positions to decide per number of plies: (index, result)
+    pending = {}
+
+    def add(level, index, value):
+        pending.setdefault(level, []).append((index, value))
+
+    #First pass: Find the legal positions, count their moves, and look up moves that leave the table
+    for index in range(size):
+        squares = [(index >> (6 * (count - 1 - i))) & 63 for i in range(count)]
+        if len(set(squares)) < count:
+            continue
+        if any(piece[1] == 'p' and (squares[i] < 8 or squares[i] >= 56) for i, piece in enumerate(pieces)):
+            continue
+        white_to_move = index < size // 2
+        own, enemy = ('w', 'b') if white_to_move else ('b', 'w')
+        occupied = 0
+        for sq in squares:
+            occupied |= BITS[sq]
+
+        #The King of the side that just moved can't be in Check
+        if attacked(squares[kings[enemy]], own, pieces, squares, occupied):
+            continue
+        status[index] = 1
+
+        legal = 0
+        inside = 0
+        best_win = None
+        longest_loss = None
+        draw_exit = False
+        for i, piece, to, captured in pseudo_moves(pieces, squares, colors, own, occupied):
+            after = list(squares)
+            after[i] = to
+            occupied_after = (occupied ^ BITS[squares[i]]) | BITS[to]
+            king = after[kings[own]]
+            if attacked(king, enemy, pieces, after, occupied_after, captured):
+                continue
+            legal += 1
+            promotion = piece[1] == 'p' and (to < 8 or to >= 56)
+            if captured < 0 and not promotion:
+                inside += 1
+                continue
+
+            #Capture or promotion: The result comes from a smaller table
+            for promoted in ("QRBN" if promotion else (piece[1],)):
+                position = [(other if j != i else own + promoted, after[j]) for j, other in enumerate(pieces) if j != captured]
+                value, distance = tablebase.lookup(position, not white_to_move)
+                if value == LOSS:
+                    if best_win is None or distance + 1 < best_win:
+                        best_win = distance + 1
+                elif value == WIN:
+                    if longest_loss is None or distance + 1 > longest_loss:
+                        longest_loss = distance + 1
+                else: draw_exit = True
+
+        if legal == 0:
+            if attacked(squares[kings[own]], enemy, pieces, squares, occupied):
+                add(0, index, LOSS)
+            else: status[index] = 2
+            continue
+        if best_win is not None:
+            add(best_win, index, WIN)
+        #A move to a drawn smaller table never runs out, so the position can't be lost
+        moves_left[index] = inside + (1 if draw_exit or best_win is not None else 0)
+        if longest_loss is not None:
+            exit_loss[index] = longest_loss
+            if moves_left[index] == 0:
+                add(longest_loss, index, LOSS)
+
+    #Retrograde analysis: Decide the positions ply by ply and pass the results back to the positions before them
+    level = 0
+    while pending:
+        decided = []
+        for index, value in pending.pop(level, ()):
+            if status[index] == 1:
+                status[index] = 2
+                result[index] = value
+                plies[index] = level
+                decided.append(index)
+        for index in decided:
+            for previous in unmoves(pieces, colors, index, count, size):
+                if status[previous] != 1:
+                    continue
+                if result[index] == LOSS:
+                    add(level + 1, previous, WIN)
+                else:
+                    moves_left[previous] -= 1
+                    if moves_left[previous] == 0:
+                        add(max(level + 1, exit_loss.get(previous, 0)), previous, LOSS)
+        level += 1
+
+    table = np.stack((result.astype(np.int16), plies))
+    os.makedirs(tablebase.directory, exist_ok=True)
+    np.save(os.path.join(tablebase.directory, name + ".npy"), table)
+    tablebase.tables[name] = table
+
+    legal = status.count(2) + status.count(1)
+    wins = int(np.count_nonzero(result == WIN))
+    losses = int(np.count_nonzero(result == LOSS))
+    log("{}: {} positions, {} wins, {} losses, {} draws, longest mate {} plies ({:.1f}s)".format(name, legal, wins, losses,
+        legal - wins - losses, int(plies.max()), time.perf_counter() - start))
+
+def pseudo_moves(pieces, squares, colors, own, occupied):
+
+    #Moves of the side own, ignoring whether they leave the own King in Check: (piece index, piece, end square, captured index)
+
+    own_squares = 0
+    for i, sq in enumerate(squares):
+        if colors[i] == own:
+            own_squares |= BITS[sq]
+    for i, piece in enumerate(pieces):
+        if colors[i] != own:
+            continue
+        sq = squares[i]
+        if piece[1] == 'p':
+            forward = -8 if own == 'w' else 8
+            targets = attacks(piece, sq, occupied) & occupied & ~own_squares
+            if not occupied & BITS[sq + forward]:
+                targets |= BITS[sq + forward]
+                if sq // 8 == (6 if own == 'w' else 1) and not occupied & BITS[sq + 2 * forward]:
+                    targets |= BITS[sq + 2 * forward]
+        else: targets = attacks(piece, sq, occupied) & ~own_squares
+        while targets:
+            to = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            captured = squares.index(to) if occupied & BITS[to] else -1
+            yield i, piece, to, captured
+
+def unmoves(pieces, colors, index, count, size):
+
+    #Indexes of all positions with the same pieces from which a move (No capture or promotion) leads to this one
+
+    squares = [(index >> (6 * (count - 1 - i))) & 63 for i in range(count)]
+    white_to_move = index < size // 2
+    moved = 'b' if white_to_move else 'w'
+    occupied = 0
+    for sq in squares:
+        occupied |= BITS[sq]
+    empty = ~occupied
+
+    for i, piece in enumerate(pieces):
+        if colors[i] != moved:
+            continue
+        sq = squares[i]
+        if piece[1] == 'p':
+            origins = 0
+            backward = 8 if moved == 'w' else -8
+            origin = sq + backward
+            if 8 <= origin < 56 and empty & BITS[origin]:
+                origins |= BITS[origin]
+                if sq // 8 == (4 if moved == 'w' else 3) and empty & BITS[origin + backward]:
+                    origins |= BITS[origin + backward]
+        else: origins = attacks(piece, sq, occupied) & empty
+        shift = 6 * (count - 1 - i)
+        #The previous position had the other side to move
+        base = (index ^ (sq << shift)) + (size // 2 if white_to_move else -size // 2)
+        while origins:
+            origin = (origins & -origins).bit_length() - 1
+            origins &= origins - 1
+            yield base | (origin << shift)
+
+def main():
+    parser = argparse.ArgumentParser(description="Endgame tablebases")
+    parser.add_argument("--directory", default=TABLEBASE_DIRECTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_generate = subparsers.add_parser("generate", help="build tables by retrograde analysis")
+    parser_generate.add_argument("names", nargs="+", help="material sets, stronger side first, e.g. KQvK KRvK KPvK")
+    parser_generate.add_argument("--force", action="store_true", help="build tables again that already exist")
+
+    parser_probe = subparsers.add_parser("probe", help="look up a position")
+    parser_probe.add_argument("--fen", required=True)
+
+    args = parser.parse_args()
+    tablebase = Tablebase(args.directory)
+    if args.command == "generate":
+        for name in args.names:
+            name = canonical([(piece, 0) for piece in table_pieces(name)], True)[0]
+            if insufficient_material(name):
+                print(name + ": Always a draw, no table needed")
+            elif args.force or tablebase.table(name) is None:
+                generate(name, tablebase)
+            else: print(name + ": Exists already")
+    else:
+        state = get_backend("bitboard").from_fen(args.fen)
+        entry = tablebase.probe(state)
+        if entry is None:
+            print("Position not in the tablebases")
+        else:
+            value, distance = entry
+            color = "White" if state.whiteToMove else "Black"
+            if value == DRAW:
+                print("Draw")
+            else: print("{} {} in {} plies".format(color, "wins" if value == WIN else "loses", distance))
+
+if __name__ == "__main__":
+    main()
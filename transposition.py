@@ -0,0 +1,137 @@
+from array import array
+
+#Transposition table: Remembers search results by position hash (GameState.zobristKey)
+#Memory is allocated once: size_mb decides how many entries fit, each slot holds one position.
+#If two positions want the same slot, the deeper search result wins, but results from earlier searches are always replaced.
+
+#Bound of a stored score
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+#Bytes per entry: key (8), score (4), move (Move.moveID, 4), depth (1), bound (1), search age (1)
+ENTRY_SIZE = 19
+
+NO_MOVE = -1
+
+#Arrays of an entry in the order they are laid out in a shared buffer (Largest items first, so they stay aligned)
+FIELDS = (("keys", 'Q'), ("scores", 'i'), ("moves", 'i'), ("depths", 'b'), ("bounds", 'b'), ("ages", 'B'))
+
+def table_entries(size_mb):
+
+    #Largest power of two that fits, so the slot of a key is a cheap bit mask
+
+    entries = max(1, size_mb * 1024 * 1024 // ENTRY_SIZE)
+    return 1 << (entries.bit_length() - 1)
+
+def table_bytes(size_mb):
+
+    #Size of the buffer for a shared table, e.g. multiprocessing.RawArray('b', table_bytes(size_mb))
+    #The entries, then one byte for the age of the current search
+
+    return table_entries(size_mb) * ENTRY_SIZE + 1
+
+class TranspositionTable():
+
+    def __init__(self, size_mb=16, buffer=None):
+
+        #buffer: Memory of a table shared between processes (See table_bytes), instead of arrays of its own
+        #The age is kept in the buffer too: next_age starts a new search for all processes, their new_search reads it
+        #Writes are not atomic: A probe can rarely see an entry mixed from two positions. Hash moves are checked
+        #with get_valid_move before they are played, a wrong score only makes that one search a bit worse
+
+        self.size_mb = size_mb
+        self.buffer = buffer
+        self.size = table_entries(size_mb)
+        self.mask = self.size - 1
+
+        if buffer is None:
+            self.keys = array('Q', bytes(8 * self.size))
+            self.scores = array('i', bytes(4 * self.size))
+            self.moves = array('i', [NO_MOVE]) * self.size
+            self.depths = array('b', bytes(self.size))
+            self.bounds = array('b', bytes(self.size))
+            self.ages = array('B', bytes(self.size))
+        else:
+            view = memoryview(buffer).cast('B')
+            offset = 0
+            for name, typecode in FIELDS:
+                length = self.size * array(typecode).itemsize
+                setattr(self, name, view[offset:offset + length].cast(typecode))
+                offset += length
+            self.shared_age = view[offset:offset + 1]
+        self.age = 1
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+
+        #Mark all stored entries as old, so they get replaced first
+        #A shared table takes the age set with next_age, so every process searching with it uses the same one
+
+        if self.buffer is None:
+            self.age = self.age % 255 + 1
+        else: self.age = self.shared_age[0]
+
+    def next_age(self):
+
+        #Shared table: Start a new search for all processes, before any of them calls new_search
+
+        self.shared_age[0] = self.shared_age[0] % 255 + 1
+
+    def clear(self):
+        if self.buffer is None:
+            self.__init__(self.size_mb)
+            return
+        #Shared table: Empty it for all processes (Entries of age 0 are unused, the next search gets age 2)
+        self.ages[:] = bytes(self.size)
+        self.shared_age[0] = 1
+        self.age = 1
+
+    def probe(self, key):
+
+        #Returns (depth, score, bound, move) for the position, or None if it isn't stored
+
+        self.probes += 1
+        slot = key & self.mask
+        if self.keys[slot] != key or self.ages[slot] == 0:
+            return None
+        self.hits += 1
+        return self.depths[slot], self.scores[slot], self.bounds[slot], self.moves[slot]
+
+    def store(self, key, depth, score, bound, move=NO_MOVE):
+
+        slot = key & self.mask
+        age = self.ages[slot]
+        if age != 0:
+            if self.keys[slot] != key:
+                #Slot used by another position: Keep it if it's from this search and was searched deeper
+                if age == self.age and self.depths[slot] > depth:
+                    return
+                self.replacements += 1
+            elif move == NO_MOVE:
+                #Same position without a best move: Keep the one found before
+                move = self.moves[slot]
+        self.stores += 1
+        self.keys[slot] = key
+        self.depths[slot] = min(depth, 127)
+        self.scores[slot] = score
+        self.bounds[slot] = bound
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes > 0 else 0.0
+
+    def usage(self):
+
+        #Share of slots filled during the current search
+
+        return self.ages.tobytes().count(self.age) / self.size
+
+    def stats(self):
+        return {"size": self.size, "probes": self.probes, "hits": self.hits, "hit_rate": self.hit_rate(),
+            "stores": self.stores, "replacements": self.replacements}
@@ -0,0 +1,313 @@
+import argparse
+import copy
+import sys
+import threading
+from engine import get_backend
+from engine import START_FEN
+from book import OpeningBook
+from parallel import ParallelSearcher
+from search import Searcher
+from search import CHECKMATE, MATE_SCORE_LIMIT
+from tablebase import Tablebase
+from transposition import NO_MOVE
+
+#UCI (Universal Chess Interface) engine on stdin/stdout, so the engine can play in GUIs and tournament programs
+#(e.g. cutechess-cli, fastchess) without a display. Nothing here imports pygame
+#
+#   python uci.py --hash 64 --book book.bin --tablebases tablebases
+#   cutechess-cli -engine cmd="python uci.py" -engine cmd=... -each proto=uci tc=40/60 -games 100
+#
+#Supported: uci, isready, ucinewgame, setoption (Hash, Threads, Backend, BookFile, TablebasePath), position startpos|fen ... moves ..., go (depth, movetime, wtime, btime,
+#winc, binc, movestogo, infinite), stop, quit
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "LucaQuade"
+
+#Time management for "go wtime ...": Share of the remaining time for this move, if movestogo is not given
+DEFAULT_MOVES_TO_GO = 30
+#Seconds kept back for the communication with the GUI, so the engine never loses on time
+MOVE_OVERHEAD = 0.05
+#Every search gets at least this many seconds, so even with little time left the move is searched
+MIN_MOVE_TIME = 0.01
+
+def parse_move(state, text):
+
+    #The valid move with this UCI notation, e.g. "e2e4" or "e7e8q". ValueError if there is none
+
+    text = text.lower()
+    for move in state.valid_moves():
+        if move.get_uci_notation() == text:
+            return move
+    raise ValueError("Illegal move: " + text)
+
+def format_score(score):
+
+    #"cp 35" or, for mate scores, "mate 3" (Moves, not plies; negative if the engine gets mated)
+
+    if abs(score) >= MATE_SCORE_LIMIT:
+        plies = CHECKMATE - abs(score)
+        return "mate {}".format((plies + 1) // 2 if score > 0 else -(plies // 2))
+    return "cp {}".format(score)
+
+def move_time(options, white_to_move):
+
+    #Seconds to search for the options of "go": movetime, or a share of the remaining time plus the increment
+    #None if there is no time limit (depth or infinite)
+
+    if "movetime" in options:
+        return max(MIN_MOVE_TIME, options["movetime"] / 1000 - MOVE_OVERHEAD)
+    time_left = options.get("wtime" if white_to_move else "btime")
+    if time_left is None:
+        return None
+    #The overhead is kept back once from the remaining time, not from every move's share of it
+    time_left = max(0.0, time_left / 1000 - MOVE_OVERHEAD)
+    increment = options.get("winc" if white_to_move else "binc", 0) / 1000
+    moves_to_go = max(1, options.get("movestogo", DEFAULT_MOVES_TO_GO))
+    seconds = time_left / moves_to_go + increment * 0.8
+    #Never use more than half of the remaining time on one move
+    return max(MIN_MOVE_TIME, min(seconds, time_left / 2))
+
+class UciEngine():
+
+    def __init__(self, backend="bitboard", hash_mb=16, book_path=None, tablebase_directory=None, threads=1, out=sys.stdout):
+        self.backend = backend
+        self.hash_mb = hash_mb
+        #More than one: Lazy SMP search with threads - 1 helper processes (See parallel.py)
+        self.threads = threads
+        self.book_path = book_path
+        self.tablebase_directory = tablebase_directory
+        self.out = out
+        #Info lines come from the search thread, everything else from the main thread
+        self.out_lock = threading.Lock()
+        self.searcher = None
+        self.state = get_backend(backend)()
+        #Arguments of the last valid position command, so the game can be set up again on another backend
+        self.position = []
+        #Thread of the running search. For "go infinite" the best move is only sent after stop
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def send(self, line):
+        with self.out_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def get_searcher(self):
+
+        #Created on first use, so setoption can change the hash size, book and tablebases before that
+
+        if self.searcher is None:
+            book = OpeningBook(self.book_path) if self.book_path else None
+            tablebase = Tablebase(self.tablebase_directory) if self.tablebase_directory else None
+            if self.threads > 1:
+                self.searcher = ParallelSearcher(self.threads, self.hash_mb, book, tablebase, self.backend)
+            else: self.searcher = Searcher(tt_size_mb=self.hash_mb, book=book, tablebase=tablebase)
+        return self.searcher
+
+    def close_searcher(self):
+        if isinstance(self.searcher, ParallelSearcher):
+            self.searcher.close()
+        self.searcher = None
+
+    def run(self, commands=sys.stdin):
+
+        #Handle commands until quit or the end of the input
+
+        for line in commands:
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+        self.close_searcher()
+
+    def handle(self, line):
+
+        #Returns False for quit
+
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default {} min 1 max 1024".format(self.hash_mb))
+            self.send("option name Threads type spin default {} min 1 max 64".format(self.threads))
+            self.send("option name Backend type combo default {} var mailbox var bitboard".format(self.backend))
+            self.send("option name BookFile type string default {}".format(self.book_path or "<empty>"))
+            self.send("option name TablebasePath type string default {}".format(self.tablebase_directory or "<empty>"))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            if self.searcher is not None:
+                self.searcher.tt.clear()
+            self.state = get_backend(self.backend)()
+            self.position = []
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "position":
+            self.stop()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            return False
+        else: self.send("info string Unknown command: " + command)
+        return True
+
+    def set_option(self, arguments):
+
+        #setoption name <name> [value <value>]. The searcher is created again with the new settings
+
+        if "name" not in arguments:
+            return
+        if "value" in arguments:
+            name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")])
+            value = " ".join(arguments[arguments.index("value") + 1:])
+        else:
+            name = " ".join(arguments[arguments.index("name") + 1:])
+            value = ""
+        if value == "<empty>":
+            value = ""
+        self.stop()
+        name = name.lower()
+        if name in ("hash", "threads"):
+            try:
+                number = max(1, int(value))
+            except ValueError:
+                self.send("info string Invalid {}: {}".format(name, value))
+                return
+            if name == "hash":
+                self.hash_mb = number
+            else: self.threads = number
+        elif name == "backend" and value in ("mailbox", "bitboard"):
+            self.backend = value
+            #Played again move by move (Not from a FEN), so repetitions of earlier positions are still seen
+            self.state = self.build_position(self.position)
+        elif name == "bookfile":
+            self.book_path = value or None
+        elif name == "tablebasepath":
+            self.tablebase_directory = value or None
+        else:
+            self.send("info string Unknown option: " + name)
+            return
+        self.close_searcher()
+
+    def set_position(self, arguments):
+
+        #position startpos|fen <FEN> [moves <move> ...]
+
+        try:
+            self.state = self.build_position(arguments)
+        except ValueError as error:
+            self.send("info string " + str(error))
+            return
+        self.position = arguments
+
+    def build_position(self, arguments):
+
+        #GameState of the position command's arguments on the current backend. ValueError if they are invalid
+
+        moves = []
+        if "moves" in arguments:
+            moves = arguments[arguments.index("moves") + 1:]
+            arguments = arguments[:arguments.index("moves")]
+        if arguments[:1] == ["fen"]:
+            fen = " ".join(arguments[1:])
+        else: fen = START_FEN
+        state = get_backend(self.backend).from_fen(fen)
+        for text in moves:
+            state.make_move(parse_move(state, text))
+        return state
+
+    def go(self, arguments):
+
+        #Start the search in its own thread, so stop and isready are answered while it runs
+
+        options = {}
+        infinite = False
+        i = 0
+        while i < len(arguments):
+            if arguments[i] == "infinite":
+                infinite = True
+            elif arguments[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and i + 1 < len(arguments):
+                try:
+                    options[arguments[i]] = int(arguments[i + 1])
+                except ValueError:
+                    #Searched anyway without it, the GUI still gets a best move
+                    self.send("info string Invalid {} ignored: {}".format(arguments[i], arguments[i + 1]))
+                i += 1
+            i += 1
+
+        #Created here and not in the search thread: Helper processes must not be started while the main thread reads stdin
+        self.get_searcher()
+        max_time = None if infinite else move_time(options, self.state.whiteToMove)
+        max_depth = options.get("depth")
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.search, args=(copy.deepcopy(self.state), max_time, max_depth, infinite),
+            daemon=True)
+        self.thread.start()
+
+    def search(self, state, max_time, max_depth, infinite):
+        searcher = self.searcher
+
+        def info(depth, score, nodes, seconds, move):
+            self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(depth, format_score(score), nodes,
+                int(nodes / seconds) if seconds > 0 else 0, int(seconds * 1000), " ".join(self.principal_variation(state, move, depth))))
+
+        result = searcher.search(state, max_time=max_time, max_depth=max_depth, info=info)
+        if result.book:
+            self.send("info string book move")
+        elif result.tablebase:
+            self.send("info string tablebase move")
+            self.send("info depth 0 score {} pv {}".format(format_score(result.score), result.move.get_uci_notation()))
+        #The GUI decides when an infinite search ends
+        if infinite:
+            self.stopped.wait()
+        self.send("bestmove " + (result.move.get_uci_notation() if result.move is not None else "0000"))
+
+    def principal_variation(self, state, move, depth):
+
+        #The expected line: The best move, then the best moves stored in the transposition table (At most depth moves)
+
+        pv = []
+        tt = self.searcher.tt
+        while move is not None and len(pv) < depth:
+            pv.append(move.get_uci_notation())
+            state.make_move(move)
+            entry = tt.probe(state.zobristKey)
+            move = state.get_valid_move(entry[3]) if entry is not None and entry[3] != NO_MOVE else None
+        for i in range(len(pv)):
+            state.undo_move()
+        return pv
+
+    def stop(self):
+
+        #Stop a running search and wait for it to send its best move
+
+        if self.thread is None:
+            return
+        self.stopped.set()
+        #Asked again until the thread ends, a stop right after go could come before the search started
+        while self.thread.is_alive():
+            if self.searcher is not None:
+                self.searcher.stop()
+            self.thread.join(0.01)
+        self.thread = None
+
+def main():
+    parser = argparse.ArgumentParser(description="UCI engine (Reads commands from stdin)")
+    parser.add_argument("--backend", default="bitboard", choices=("mailbox", "bitboard"))
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("--threads", type=int, default=1, help="search processes (Lazy SMP)")
+    parser.add_argument("--book", default=None, help="opening book (Built with book.py)")
+    parser.add_argument("--tablebases", default=None, help="directory of endgame tablebases (Built with tablebase.py)")
+    args = parser.parse_args()
+    UciEngine(args.backend, args.hash, args.book, args.tablebases, args.threads).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import copy
+import queue
+import threading
+from collections import namedtuple
+from engine import GameResult
+from search import Searcher
+
+#Background thread for everything expensive in a turn, so the window never waits for it:
+#Valid moves and status of the position, and the computer's move if it is its turn
+#Every request works on its own copy of the GameState, so the game can go on (or be undone) meanwhile
+#
+#   worker = EngineWorker(notify=...)
+#   worker.request(state, search=True)
+#   ...after notify was called:
+#   for analysis in worker.results():
+#       ...
+
+#valid_moves and result of the position, search is the SearchResult of the computer's move (Or None)
+Analysis = namedtuple("Analysis", "valid_moves result search")
+
+class EngineWorker():
+
+    def __init__(self, move_time=1.0, notify=None, searcher=None):
+
+        #notify() is called from the worker thread whenever a result is ready
+
+        self.move_time = move_time
+        self.notify = notify
+        self.searcher = searcher if searcher is not None else Searcher()
+        self.requests = queue.Queue()
+        self.answers = queue.Queue()
+        #Every request gets a new generation, answers of older generations are dropped
+        self.generation = 0
+        #Set by cancel to stop the search of the current request. Every request gets its own, so a cancel that comes
+        #before the search started is not lost (search resets Searcher.stop_requested when it starts)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request(self, state, search=False):
+
+        #Analyze the current position (And search the computer's move if search), earlier requests are cancelled
+
+        self.cancel()
+        self.cancelled = threading.Event()
+        self.requests.put((self.generation, copy.deepcopy(state), search, self.cancelled))
+
+    def cancel(self):
+
+        #Forget all requests so far and stop a running search, e.g. when a move is undone
+
+        self.generation += 1
+        self.cancelled.set()
+        self.searcher.stop()
+
+    def results(self):
+
+        #Answers that arrived for the current request, without waiting
+
+        answers = []
+        while True:
+            try:
+                generation, analysis = self.answers.get_nowait()
+            except queue.Empty:
+                return answers
+            if generation == self.generation:
+                answers.append(analysis)
+
+    def stop(self):
+        self.cancel()
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            job = self.requests.get()
+            if job is None:
+                return
+            generation, state, search, cancelled = job
+            if cancelled.is_set():
+                continue
+            valid_moves = state.valid_moves()
+            result = state.gameResult()
+            search_result = None
+            if search and result == GameResult.ONGOING and not cancelled.is_set():
+                self.searcher.stop_event = cancelled
+                search_result = self.searcher.search(state, max_time=self.move_time)
+            self.answers.put((generation, Analysis(valid_moves, result, search_result)))
+            if self.notify is not None:
+                self.notify()
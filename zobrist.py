@@ -0,0 +1,43 @@
+import random
+
+#Zobrist hashing: Every piece on every square, the side to move, every set of castling rights and every En passant file
+#get a random 64-bit number. The hash of a position is all numbers that apply to it XORed together,
+#so make_move only has to XOR in and out what changed
+
+_random = random.Random(20240601)
+
+ZOBRIST_PIECES = {piece: [_random.getrandbits(64) for sq in range(64)]
+    for piece in ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")}
+ZOBRIST_BLACK_TO_MOVE = _random.getrandbits(64)
+ZOBRIST_CASTLING = [_random.getrandbits(64) for rights in range(16)]
+ZOBRIST_EN_PASSANT = [_random.getrandbits(64) for col in range(8)]
+
+def en_passant_key(state):
+
+    #The En passant file is only part of the hash if a Pawn can actually capture there,
+    #otherwise positions that only differ by an unusable En passant square would look different
+
+    if not state.enPassantPossible:
+        return 0
+    row, col = state.enPassantPossible
+    pawn_row = row + 1 if state.whiteToMove else row - 1
+    pawn = 'wp' if state.whiteToMove else 'bp'
+    if (col > 0 and state.board[pawn_row][col - 1] == pawn) or (col < 7 and state.board[pawn_row][col + 1] == pawn):
+        return ZOBRIST_EN_PASSANT[col]
+    return 0
+
+def hash_position(state):
+
+    #Hash of the whole position, computed from scratch
+
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = state.board[row][col]
+            if piece != "--":
+                key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+    if not state.whiteToMove:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    key ^= ZOBRIST_CASTLING[state.castlingRights]
+    key ^= en_passant_key(state)
+    return key